@@ -0,0 +1,33 @@
+import argparse
+import sys
+
+from . import reports
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m viz")
+    commands = parser.add_subparsers(dest="command", required=True)
+    reports.build_parser(commands.add_parser("report", help="render HTML reports"))
+    cache = commands.add_parser("cache", help="inspect the shared dataset cache")
+    cache.add_argument("action", choices=["stats", "clear"])
+    cache.add_argument("--root", help="cache directory, default /dev/shm/viz-datasets")
+    cache.add_argument("--force", action="store_true", help="also drop attached")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        _, errors = reports.run(args)
+        # Non-zero so a nightly batch notices partial failures
+        return 1 if errors else 0
+    elif args.command == "cache":
+        from . import dataset_cache
+
+        dataset_cache.enable(args.root)
+        if args.action == "clear":
+            dataset_cache.clear(force=args.force)
+        stats = dataset_cache.stats()
+        print(stats.to_string(index=False) if not stats.empty else "cache is empty")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
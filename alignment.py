@@ -0,0 +1,240 @@
+"""As-of alignment of event streams (fills, trades) against keyed snapshots.
+
+Each target frame (bbos, tobs, info, backtest theos, ...) is sorted and indexed
+once in an ``AsofIndex``; lookups for any number of events, coins and lags are
+then a single ``np.searchsorted`` over a combined (key, time) axis.
+"""
+
+import numpy as np
+import pandas as pd
+
+_NAT = np.iinfo(np.int64).min
+
+
+def _to_ns(values) -> np.ndarray:
+    values = pd.DatetimeIndex(values)
+    if values.tz is not None:
+        values = values.tz_convert(None)
+    return values.as_unit("ns").asi8
+
+
+def _signs(df: pd.DataFrame, side_col: str = "side") -> np.ndarray:
+    if "sign" in df.columns:
+        return df["sign"].to_numpy(dtype=float)
+    return np.where(df[side_col].to_numpy() == "B", 1.0, -1.0)
+
+
+class AsofIndex:
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        columns: list[str] | None = None,
+        time_col: str = "time",
+        by: str | None = "friendly_coin",
+    ):
+        if columns is None:
+            columns = [c for c in df.columns if c not in (time_col, by)]
+        self.columns = list(columns)
+        self.time_col = time_col
+        self.by = by
+
+        times = _to_ns(df[time_col])
+        if by is None:
+            codes = np.zeros(len(df), dtype=np.int64)
+            self.keys = pd.Index([None])
+        else:
+            codes, uniques = pd.factorize(df[by], sort=True)
+            codes = codes.astype(np.int64)
+            self.keys = pd.Index(uniques)
+
+        keep = (times != _NAT) & (codes >= 0)
+        order = np.flatnonzero(keep)[np.lexsort((times[keep], codes[keep]))]
+        self.codes = codes[order]
+        self.times = times[order]
+        self.values = {c: df[c].to_numpy()[order] for c in self.columns}
+
+        if len(self.times):
+            # Offsets live in [1, span - 2] so that queries clipped to one past
+            # either end still land on the correct side of every key segment.
+            self._base = int(self.times.min()) - 1
+            self._span = int(self.times.max()) - self._base + 2
+        else:
+            self._base, self._span = 0, 1
+        self._fits_int64 = len(self.keys) * self._span < 2**62
+        if self._fits_int64:
+            self._composite = self.codes * self._span + (self.times - self._base)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _query_codes(self, keys, n: int) -> np.ndarray:
+        if self.by is None:
+            return np.zeros(n, dtype=np.int64)
+        return self.keys.get_indexer(pd.Index(keys)).astype(np.int64)
+
+    def positions(
+        self,
+        keys,
+        times,
+        lag: str | pd.Timedelta | None = None,
+        allow_exact_matches: bool = True,
+        tolerance: str | pd.Timedelta | None = None,
+    ) -> np.ndarray:
+        qt = _to_ns(times)
+        valid = qt != _NAT
+        if lag is not None:
+            qt = np.where(valid, qt + pd.Timedelta(lag).value, _NAT)
+        qcodes = self._query_codes(keys, len(qt))
+        valid &= qcodes >= 0
+        if not len(self.times):
+            return np.full(len(qt), -1, dtype=np.int64)
+
+        side = "right" if allow_exact_matches else "left"
+        if self._fits_int64:
+            clipped = np.clip(qt, self._base, self._base + self._span - 1)
+            q = np.where(valid, qcodes, 0) * self._span + (clipped - self._base)
+            pos = np.searchsorted(self._composite, q, side=side) - 1
+        else:
+            pos = np.full(len(qt), -1, dtype=np.int64)
+            starts = np.searchsorted(self.codes, np.arange(len(self.keys)), "left")
+            ends = np.searchsorted(self.codes, np.arange(len(self.keys)), "right")
+            for code in np.unique(qcodes[valid]):
+                mask = valid & (qcodes == code)
+                seg = self.times[starts[code] : ends[code]]
+                pos[mask] = starts[code] + np.searchsorted(seg, qt[mask], side) - 1
+
+        safe = np.clip(pos, 0, None)
+        valid &= (pos >= 0) & (self.codes[safe] == qcodes)
+        if allow_exact_matches:
+            valid &= self.times[safe] <= qt
+        else:
+            valid &= self.times[safe] < qt
+        if tolerance is not None:
+            valid &= qt - self.times[safe] <= pd.Timedelta(tolerance).value
+        return np.where(valid, pos, -1)
+
+    def take(self, pos: np.ndarray, columns: list[str] | None = None) -> dict:
+        out = {}
+        for col in columns or self.columns:
+            if col == self.time_col:
+                values = self.times.view("datetime64[ns]")
+            else:
+                values = self.values[col]
+            out[col] = pd.api.extensions.take(values, pos, allow_fill=True)
+        return out
+
+    def lookup(
+        self,
+        keys,
+        times,
+        columns: list[str] | None = None,
+        lag: str | pd.Timedelta | None = None,
+        allow_exact_matches: bool = True,
+        tolerance: str | pd.Timedelta | None = None,
+    ) -> dict:
+        pos = self.positions(keys, times, lag, allow_exact_matches, tolerance)
+        return self.take(pos, columns)
+
+
+def _as_index(target, by) -> AsofIndex:
+    if isinstance(target, AsofIndex):
+        return target
+    return AsofIndex(target, by=by)
+
+
+def bbo_index(bbos_df: pd.DataFrame, by: str = "friendly_coin") -> AsofIndex:
+    bbos_df = bbos_df[["time", by, "bid_px", "ask_px"]].copy()
+    bbos_df["bid_px"] = bbos_df["bid_px"].astype(float)
+    bbos_df["ask_px"] = bbos_df["ask_px"].astype(float)
+    bbos_df["mid"] = (bbos_df["bid_px"] + bbos_df["ask_px"]) / 2
+    return AsofIndex(bbos_df, by=by)
+
+
+def align(
+    events: pd.DataFrame,
+    targets: dict[str, "AsofIndex | pd.DataFrame"],
+    lags: list[str] | None = None,
+    time_col: str = "time",
+    by: str | dict[str, str] = "friendly_coin",
+    allow_exact_matches: bool = True,
+    tolerance: str | pd.Timedelta | None = None,
+) -> pd.DataFrame:
+    times = events[time_col].to_numpy()
+    new_cols = {}
+    for name, target in targets.items():
+        event_by = by[name] if isinstance(by, dict) else by
+        index = _as_index(target, event_by)
+        keys = events[event_by].to_numpy() if index.by is not None else None
+        for lag in [None] + list(lags or []):
+            values = index.lookup(
+                keys,
+                times,
+                lag=lag,
+                allow_exact_matches=allow_exact_matches,
+                tolerance=tolerance,
+            )
+            suffix = "" if lag is None else f"_{lag}"
+            for col, arr in values.items():
+                new_cols[f"{name}_{col}{suffix}"] = arr
+
+    added = pd.DataFrame(new_cols, index=events.index)
+    events = events.drop(columns=added.columns, errors="ignore")
+    return pd.concat([events, added], axis=1)
+
+
+def markouts(
+    fills_df: pd.DataFrame,
+    bbos: "AsofIndex | pd.DataFrame",
+    horizons: tuple[str, ...] = ("1s", "10s", "60s"),
+    theos: "AsofIndex | pd.DataFrame | None" = None,
+    time_col: str = "time",
+    by: str = "friendly_coin",
+    theo_by: str | None = None,
+    side_col: str = "side",
+    allow_exact_matches: bool = True,
+) -> pd.DataFrame:
+    if not isinstance(bbos, AsofIndex):
+        bbos = bbo_index(bbos)
+    keys = fills_df[by].to_numpy()
+    times = fills_df[time_col].to_numpy()
+    sign = _signs(fills_df, side_col)
+    px = fills_df["px"].to_numpy(dtype=float)
+    sz = fills_df["sz"].to_numpy(dtype=float)
+
+    out = fills_df.copy()
+    at_fill = bbos.lookup(keys, times, ["mid"], allow_exact_matches=allow_exact_matches)
+    out["mid"] = at_fill["mid"]
+    out["edge_bps"] = sign * (out["mid"].to_numpy() - px) / px * 10000
+    out["edge"] = sign * (out["mid"].to_numpy() - px) * sz
+
+    if theos is not None:
+        theo_by = theo_by or by
+        theos = _as_index(theos, theo_by)
+        theo_keys = fills_df[theo_by].to_numpy() if theos.by is not None else None
+        theo = theos.lookup(
+            theo_keys, times, ["theo"], allow_exact_matches=allow_exact_matches
+        )["theo"].astype(float)
+        out["theo"] = theo
+        out["theo_edge_bps"] = sign * (theo - px) / px * 10000
+
+    for horizon in horizons:
+        mid = bbos.lookup(keys, times, ["mid"], lag=horizon)["mid"]
+        out[f"mid_{horizon}"] = mid
+        out[f"markout_bps_{horizon}"] = sign * (mid - px) / px * 10000
+        out[f"pnl_{horizon}"] = sign * (mid - px) * sz
+    return out
+
+
+def markout_summary(
+    markouts_df: pd.DataFrame, by: list[str] | str = "friendly_coin"
+) -> pd.DataFrame:
+    notional = markouts_df["px"] * markouts_df["sz"]
+    cols = [c for c in markouts_df.columns if c.startswith(("pnl_", "edge"))]
+    grouped = markouts_df.assign(notional=notional).groupby(by)
+    summary = grouped[["notional"] + [c for c in cols if c != "edge_bps"]].sum()
+    summary.insert(0, "fills", grouped.size())
+    for col in [c for c in markouts_df.columns if c.startswith("markout_bps_")]:
+        horizon = col[len("markout_bps_") :]
+        summary[col] = summary[f"pnl_{horizon}"] / summary["notional"] * 10000
+    summary["edge_bps"] = summary["edge"] / summary["notional"] * 10000
+    return summary.reset_index()
@@ -0,0 +1,432 @@
+"""Offline benchmarks for the data_fetching and plotting hot paths.
+
+    python -m viz.benchmark --sizes 10000 100000 --out bench.json
+    python -m viz.benchmark --sizes 10000 100000 --out new.json --compare bench.json
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import re
+import time
+import tracemalloc
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from . import data_fetching, dataset_cache
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+DEFAULT_COINS = ["BTC", "ETH", "SOL", "HYPE"]
+START_TIME = pd.Timestamp("2025-01-01")
+
+
+class FakeClient:
+    def __init__(self, tables: dict[str, pd.DataFrame]):
+        self.tables = tables
+        self.queries: list[str] = []
+
+    def query_df(self, query: str) -> pd.DataFrame:
+        self.queries.append(query)
+        match = re.search(r"FROM\s+([\w.]+)", query)
+        if match is None or match.group(1) not in self.tables:
+            raise KeyError(f"no local data for query: {query}")
+        # query_df always hands back a fresh frame, so copy to mimic the decode
+        return self.tables[match.group(1)].copy()
+
+
+def _times(n: int, rng: np.random.Generator, span="1D") -> np.ndarray:
+    span_ns = pd.Timedelta(span).value
+    offsets = np.sort(rng.integers(0, span_ns, size=n))
+    return START_TIME.value + offsets
+
+
+def _coins(n: int, coins: list[str], rng: np.random.Generator) -> np.ndarray:
+    return np.asarray(coins, dtype=object)[rng.integers(0, len(coins), size=n)]
+
+
+def _mids(coins_col: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    base = {c: 10.0 ** (i % 5) * 3 for i, c in enumerate(np.unique(coins_col))}
+    walk = np.exp(np.cumsum(rng.normal(0, 1e-5, size=len(coins_col))))
+    return np.array([base[c] for c in coins_col]) * walk
+
+
+def synthetic_bbos(n: int, coins=DEFAULT_COINS, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    time_ns = _times(n, rng)
+    coin = _coins(n, coins, rng)
+    mid = _mids(coin, rng)
+    half_spread = mid * rng.uniform(0.5, 2, size=n) / 10000
+    return pd.DataFrame(
+        {
+            "friendly_coin": coin,
+            "capture_time": pd.to_datetime(time_ns + rng.integers(1e5, 1e7, size=n)),
+            "time": pd.to_datetime(time_ns),
+            "bid_px": mid - half_spread,
+            "ask_px": mid + half_spread,
+        }
+    )
+
+
+def synthetic_trades(n: int, coins=DEFAULT_COINS, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    time_ns = _times(n, rng)
+    coin = _coins(n, coins, rng)
+    users = np.array([f"0x{i:040x}" for i in range(64)], dtype=object)
+    return pd.DataFrame(
+        {
+            "friendly_coin": coin,
+            "capture_time": pd.to_datetime(time_ns + rng.integers(1e5, 1e7, size=n)),
+            "time": pd.to_datetime(time_ns),
+            "side": np.where(rng.random(n) < 0.5, "B", "A").astype(object),
+            "px": _mids(coin, rng),
+            "sz": rng.exponential(1.0, size=n),
+            "tid": rng.integers(0, 2**62, size=n),
+            "buy_user": users[rng.integers(0, len(users), size=n)],
+            "sell_user": users[rng.integers(0, len(users), size=n)],
+        }
+    )
+
+
+def synthetic_books(n: int, coins=DEFAULT_COINS, levels=20, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    time_ns = _times(n, rng)
+    coin = _coins(n, coins, rng)
+    mid = _mids(coin, rng)
+    ticks = (mid / 10000)[:, None] * np.arange(1, levels + 1)[None, :]
+    bids_px = mid[:, None] - ticks
+    asks_px = mid[:, None] + ticks
+    bids_sz = rng.exponential(1.0, size=(n, levels))
+    asks_sz = rng.exponential(1.0, size=(n, levels))
+    counts = rng.integers(1, 10, size=(n, levels))
+    return pd.DataFrame(
+        {
+            "friendly_coin": coin,
+            "capture_time": pd.to_datetime(time_ns + rng.integers(1e5, 1e7, size=n)),
+            "time": pd.to_datetime(time_ns),
+            "bids_px": list(bids_px),
+            "asks_px": list(asks_px),
+            "bids_sz": list(bids_sz),
+            "asks_sz": list(asks_sz),
+            "bids_n": list(counts),
+            "asks_n": list(counts),
+        }
+    )
+
+
+def synthetic_info(n: int, strategies=("mm_a", "mm_b"), seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    strategy = np.asarray(strategies, dtype=object)[
+        rng.integers(0, len(strategies), size=n)
+    ]
+    return pd.DataFrame(
+        {
+            "time": pd.to_datetime(_times(n, rng)),
+            "strategy_name": strategy,
+            "theo": _mids(strategy, rng),
+            "lean_bps": rng.normal(0, 2, size=n),
+        }
+    )
+
+
+def synthetic_theos(
+    n: int, features=("imbalance", "momentum", "basis"), seed=0
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"time": pd.to_datetime(_times(n, rng))})
+    df["mid"] = 100 * np.exp(np.cumsum(rng.normal(0, 1e-5, size=n)))
+    for feat in features:
+        df[feat] = rng.normal(0, 0.01, size=n)
+    df["theo"] = df["mid"] + df[list(features)].sum(axis=1)
+    return df
+
+
+def synthetic_fills(n: int, coins=DEFAULT_COINS, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    coin = _coins(n, coins, rng)
+    return pd.DataFrame(
+        {
+            "time": pd.to_datetime(_times(n, rng)),
+            "coin": coin,
+            "side": np.where(rng.random(n) < 0.5, "B", "A").astype(object),
+            "px": _mids(coin, rng),
+            "sz": rng.exponential(1.0, size=n),
+            "strategy_name": "mm_a",
+        }
+    )
+
+
+def write_theo_jsonl(
+    directory: str, n: int, coins=DEFAULT_COINS, features=("imbalance", "momentum")
+):
+    rng = np.random.default_rng(0)
+    time_ns = _times(n, rng)
+    coin = _coins(n, coins, rng)
+    mid = _mids(coin, rng)
+    feats = rng.normal(0, 0.01, size=(n, len(features)))
+    with open(os.path.join(directory, "theo.jsonl"), "w") as f:
+        for i in range(n):
+            values = [[name, float(v)] for name, v in zip(features, feats[i])]
+            record = {
+                "time": int(time_ns[i]),
+                "friendly_coin": coin[i],
+                "mid": float(mid[i]),
+                "theo": float(mid[i] + feats[i].sum()),
+                "float_values": values,
+            }
+            f.write(json.dumps(record) + "\n")
+
+
+def write_fills_jsonl(
+    directory: str, n: int, coins=DEFAULT_COINS, fills_per_line: int = 1
+):
+    rng = np.random.default_rng(0)
+    time_ms = _times(n, rng) // 1_000_000
+    coin = _coins(n, coins, rng)
+    px = _mids(coin, rng)
+    sz = rng.exponential(1.0, size=n)
+    side = np.where(rng.random(n) < 0.5, "B", "A")
+    with open(os.path.join(directory, "fills.jsonl"), "w") as f:
+        for start in range(0, n, fills_per_line):
+            batch = []
+            for i in range(start, min(start + fills_per_line, n)):
+                batch.append(
+                    {
+                        "coin": coin[i],
+                        "px": f"{px[i]:.6f}",
+                        "sz": f"{sz[i]:.4f}",
+                        "side": str(side[i]),
+                        "time": int(time_ms[i]),
+                        "startPosition": "0.0",
+                        "dir": "Open Long" if side[i] == "B" else "Open Short",
+                        "closedPnl": "0.0",
+                        "hash": "0x0",
+                        "oid": i,
+                        "crossed": bool(i % 2),
+                        "fee": f"{px[i] * sz[i] * 1e-4:.6f}",
+                        "tid": i,
+                        "feeToken": "USDC",
+                    }
+                )
+            f.write(json.dumps({"user": "0x" + "0" * 40, "fills": batch}) + "\n")
+
+
+def backtest_directory(work_dir: str, n: int) -> str:
+    directory = os.path.join(work_dir, f"backtest_{n}")
+    if not os.path.exists(os.path.join(directory, ".complete")):
+        os.makedirs(directory, exist_ok=True)
+        write_theo_jsonl(directory, n)
+        write_fills_jsonl(directory, n)
+        open(os.path.join(directory, ".complete"), "w").close()
+    return directory
+
+
+def _figure():
+    from bokeh.plotting import figure
+
+    return figure(x_axis_type="datetime")
+
+
+def _fetch_case(fn, table, generator, **kwargs):
+    def setup(n, work_dir):
+        return FakeClient({table: generator(n)})
+
+    def run(client, n):
+        end_time = START_TIME + pd.Timedelta("1D")
+        return fn(client, START_TIME, end_time, DEFAULT_COINS, **kwargs)
+
+    return setup, run
+
+
+def _backtest_case(fn):
+    def setup(n, work_dir):
+        return backtest_directory(work_dir, n)
+
+    def run(directory, n):
+        return fn(directory, max_rows=n)
+
+    return setup, run
+
+
+def _plot_case(fn, generator, *args):
+    def setup(n, work_dir):
+        return generator(n)
+
+    def run(df, n):
+        return fn(_figure(), df, *args)
+
+    return setup, run
+
+
+def _frame_case(fn, generator, **kwargs):
+    def setup(n, work_dir):
+        return generator(n)
+
+    def run(df, n):
+        return fn(df, **kwargs)
+
+    return setup, run
+
+
+def _cases() -> dict[str, tuple]:
+    from . import book_analytics, plotting
+
+    return {
+        "bbos": _fetch_case(data_fetching.bbos, "hyperliquid.bbo", synthetic_bbos),
+        "bbos_lags": _fetch_case(
+            data_fetching.bbos, "hyperliquid.bbo", synthetic_bbos, lags=["1s", "10s"]
+        ),
+        "tobs": _fetch_case(data_fetching.tobs, "hyperliquid.tobs", synthetic_bbos),
+        "trades": _fetch_case(
+            data_fetching.trades, "hyperliquid.trades", synthetic_trades
+        ),
+        "books": _fetch_case(
+            data_fetching.books, "hyperliquid.l2_book", synthetic_books
+        ),
+        "book_metrics": _frame_case(book_analytics.book_metrics, synthetic_books),
+        "backtest_theos": _backtest_case(data_fetching.backtest_theos),
+        "backtest_fills": _backtest_case(data_fetching.backtest_fills),
+        "add_fills_to_fig": _plot_case(plotting.add_fills_to_fig, synthetic_fills),
+        "add_theo_with_lean_to_fig": _plot_case(
+            plotting.add_theo_with_lean_to_fig, synthetic_info
+        ),
+        "add_theo_and_features_to_fig": _plot_case(
+            plotting.add_theo_and_features_to_fig,
+            synthetic_theos,
+            ["imbalance", "momentum", "basis"],
+        ),
+    }
+
+
+# l2 books carry a list column per side, so 10M rows does not fit in memory
+MAX_SIZES = {"books": 1_000_000, "book_metrics": 1_000_000}
+
+
+def _cold():
+    # Every repeat measures the uncached path, memoized plot data would
+    # otherwise turn repeats 2..n and the traced run into cache hits
+    from . import plotting
+
+    plotting.clear_cache()
+    gc.collect()
+
+
+def _measure(run, state, n, repeats: int) -> dict[str, Any]:
+    timings = []
+    result = None
+    for _ in range(repeats):
+        _cold()
+        t0 = time.perf_counter()
+        result = run(state, n)
+        timings.append(time.perf_counter() - t0)
+    rows_out = len(result) if isinstance(result, pd.DataFrame) else None
+    del result
+
+    _cold()
+    tracemalloc.start()
+    try:
+        run(state, n)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": min(timings),
+        "mean_seconds": float(np.mean(timings)),
+        "repeats": repeats,
+        "peak_bytes": peak,
+        "rows_out": rows_out,
+    }
+
+
+def run_benchmarks(
+    sizes: list[int] | None = None,
+    cases: list[str] | None = None,
+    repeats: int = 3,
+    work_dir: str = ".bench_data",
+) -> dict[str, Any]:
+    sizes = sizes or DEFAULT_SIZES
+    all_cases = _cases()
+    cases = cases or list(all_cases)
+    os.makedirs(work_dir, exist_ok=True)
+    # VIZ_DATASET_CACHE would turn every fetch case after the first into a hit
+    dataset_cache.disable()
+
+    results = []
+    for name in cases:
+        setup, run = all_cases[name]
+        for n in sizes:
+            if n > MAX_SIZES.get(name, n):
+                continue
+            record = {"case": name, "size": n}
+            try:
+                state = setup(n, work_dir)
+                record.update(_measure(run, state, n, repeats))
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+            finally:
+                state = None
+            print(json.dumps(record))
+            results.append(record)
+
+    return {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "node": platform.node(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any]) -> pd.DataFrame:
+    cols = ["case", "size", "seconds", "peak_bytes"]
+
+    def frame(report):
+        df = pd.DataFrame(report["results"])
+        return df.reindex(columns=cols).dropna(subset=["seconds"])
+
+    df = frame(baseline).merge(
+        frame(current), on=["case", "size"], suffixes=("_base", "_new")
+    )
+    df["time_ratio"] = df["seconds_new"] / df["seconds_base"]
+    df["mem_ratio"] = df["peak_bytes_new"] / df["peak_bytes_base"]
+    return df.sort_values(by=["case", "size"])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m viz.benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--cases", nargs="+", default=None)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--work-dir", default=".bench_data")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--compare", default=None, help="baseline report to diff")
+    parser.add_argument(
+        "--threshold", type=float, default=1.2, help="time ratio that fails --compare"
+    )
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.cases, args.repeats, args.work_dir)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        diff = compare(baseline, report)
+        print(diff.to_string(index=False))
+        if (diff["time_ratio"] > args.threshold).any():
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,164 @@
+"""Vectorized depth and liquidity metrics over ``books``/``minute_books`` output.
+
+The per-row level arrays are packed once into dense ``(snapshots, levels)``
+matrices; every metric is then a batched NumPy expression over all snapshots
+and coins at once.
+"""
+
+import numpy as np
+import pandas as pd
+
+SIDES = ["bids_px", "bids_sz", "asks_px", "asks_sz"]
+
+
+def _pack(col: pd.Series, levels: int | None, fill: float) -> np.ndarray:
+    values = col.to_list()
+    n = len(values)
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=n)
+    width = int(lengths.max(initial=0))
+    if levels is not None:
+        width = min(width, levels)
+    # An empty window or a book with no levels still gets a (missing) top level
+    width = max(width, 1)
+    if not lengths.sum():
+        return np.full((n, width), fill)
+
+    flat = np.concatenate(values).astype(float)
+    if (lengths == lengths[0]).all():
+        return flat.reshape(n, -1)[:, :width]
+
+    out = np.full((n, width), fill)
+    rows = np.repeat(np.arange(n), lengths)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    keep = cols < width
+    out[rows[keep], cols[keep]] = flat[keep]
+    return out
+
+
+def dense_book(books_df: pd.DataFrame, levels: int | None = None) -> dict:
+    dense = {
+        "time": books_df["time"].to_numpy(),
+        "friendly_coin": books_df["friendly_coin"].to_numpy(),
+    }
+    for side in SIDES:
+        # Missing levels have no price and no size, so they drop out of sums
+        fill = np.nan if side.endswith("_px") else 0.0
+        dense[side] = _pack(books_df[side], levels, fill)
+    return dense
+
+
+def mid(dense: dict) -> np.ndarray:
+    return (dense["bids_px"][:, 0] + dense["asks_px"][:, 0]) / 2
+
+
+def spread_bps(dense: dict) -> np.ndarray:
+    bid, ask = dense["bids_px"][:, 0], dense["asks_px"][:, 0]
+    return (ask - bid) / ((ask + bid) / 2) * 10000
+
+
+def microprice(dense: dict) -> np.ndarray:
+    bid, ask = dense["bids_px"][:, 0], dense["asks_px"][:, 0]
+    bid_sz, ask_sz = dense["bids_sz"][:, 0], dense["asks_sz"][:, 0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (bid * ask_sz + ask * bid_sz) / (bid_sz + ask_sz)
+
+
+def imbalance(dense: dict, levels: int = 1) -> np.ndarray:
+    bid_sz = dense["bids_sz"][:, :levels].sum(axis=1)
+    ask_sz = dense["asks_sz"][:, :levels].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (bid_sz - ask_sz) / (bid_sz + ask_sz)
+
+
+def depth_at_bps(dense: dict, bps: list[float]) -> tuple[np.ndarray, np.ndarray]:
+    ref = mid(dense)[:, None]
+    bids_px, asks_px = dense["bids_px"], dense["asks_px"]
+    bids_ntl = np.nan_to_num(bids_px * dense["bids_sz"])
+    asks_ntl = np.nan_to_num(asks_px * dense["asks_sz"])
+
+    bid_depth = np.empty((len(ref), len(bps)))
+    ask_depth = np.empty((len(ref), len(bps)))
+    with np.errstate(invalid="ignore"):
+        for j, band in enumerate(bps):
+            bid_depth[:, j] = (bids_ntl * (bids_px >= ref * (1 - band / 10000))).sum(1)
+            ask_depth[:, j] = (asks_ntl * (asks_px <= ref * (1 + band / 10000))).sum(1)
+    return bid_depth, ask_depth
+
+
+def _walk(px: np.ndarray, sz: np.ndarray, notionals: list[float]) -> np.ndarray:
+    n, width = px.shape
+    cum_ntl = np.cumsum(np.nan_to_num(px * sz), axis=1)
+    cum_sz = np.cumsum(sz, axis=1)
+    # Prepend a zero column so level k's "before" totals are column k
+    prev_ntl = np.hstack([np.zeros((n, 1)), cum_ntl])
+    prev_sz = np.hstack([np.zeros((n, 1)), cum_sz])
+    rows = np.arange(n)
+
+    avg_px = np.full((n, len(notionals)), np.nan)
+    for j, target in enumerate(notionals):
+        k = (cum_ntl < target).sum(axis=1)
+        ok = k < width
+        kk = np.minimum(k, width - 1)
+        level_px = px[rows, kk]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            filled = prev_sz[rows, kk] + (target - prev_ntl[rows, kk]) / level_px
+            avg_px[:, j] = np.where(ok, target / filled, np.nan)
+    return avg_px
+
+
+def cost_to_trade(dense: dict, notionals: list[float]) -> tuple[np.ndarray, np.ndarray]:
+    ref = mid(dense)[:, None]
+    buy_px = _walk(dense["asks_px"], dense["asks_sz"], notionals)
+    sell_px = _walk(dense["bids_px"], dense["bids_sz"], notionals)
+    return (buy_px / ref - 1) * 10000, (1 - sell_px / ref) * 10000
+
+
+def _label(x: float) -> str:
+    return str(int(x)) if float(x).is_integer() else f"{x:g}"
+
+
+def book_metrics(
+    books_df: pd.DataFrame,
+    bps: tuple[float, ...] = (5, 10, 25, 50, 100),
+    notionals: tuple[float, ...] = (1_000, 10_000, 100_000, 1_000_000),
+    imbalance_levels: tuple[int, ...] = (1, 5),
+    levels: int | None = None,
+) -> pd.DataFrame:
+    dense = dense_book(books_df, levels)
+    out = {
+        "time": dense["time"],
+        "friendly_coin": dense["friendly_coin"],
+        "mid": mid(dense),
+        "spread_bps": spread_bps(dense),
+        "microprice": microprice(dense),
+    }
+    for k in imbalance_levels:
+        out[f"imbalance_{k}"] = imbalance(dense, k)
+
+    bid_depth, ask_depth = depth_at_bps(dense, bps)
+    for j, band in enumerate(bps):
+        out[f"bid_depth_{_label(band)}bps"] = bid_depth[:, j]
+        out[f"ask_depth_{_label(band)}bps"] = ask_depth[:, j]
+
+    buy_cost, sell_cost = cost_to_trade(dense, notionals)
+    for j, notional in enumerate(notionals):
+        out[f"buy_cost_bps_{_label(notional)}"] = buy_cost[:, j]
+        out[f"sell_cost_bps_{_label(notional)}"] = sell_cost[:, j]
+
+    return pd.DataFrame(out, index=books_df.index)
+
+
+def depth_profile(
+    books_df: pd.DataFrame,
+    bps: tuple[float, ...] = (5, 10, 25, 50, 100),
+    by: str = "friendly_coin",
+    levels: int | None = None,
+) -> pd.DataFrame:
+    dense = dense_book(books_df, levels)
+    bid_depth, ask_depth = depth_at_bps(dense, bps)
+    df = pd.DataFrame(
+        {by: books_df[by].to_numpy()}
+        | {f"bid_{_label(b)}bps": bid_depth[:, j] for j, b in enumerate(bps)}
+        | {f"ask_{_label(b)}bps": ask_depth[:, j] for j, b in enumerate(bps)}
+    )
+    return df.groupby(by).median()
@@ -4,7 +4,13 @@ import json
 import os
 from typing import Any
 
+from . import instrumentation
+from .dataset_cache import cached
+from .instrumentation import instrumented, stage
 
+
+@instrumented
+@cached
 def orders(
     client, start_time, end_time, strategy_name, database="strategy"
 ) -> pd.DataFrame:
@@ -29,12 +35,16 @@ def orders(
         WHERE status_timestamp > '{start_time}' AND status_timestamp < '{end_time}' AND strategy_name = '{strategy_name}'
         ORDER BY status_timestamp
         LIMIT 500000;"""
-    df = client.query_df(query)
-    df["status_timestamp"] = pd.to_datetime(df["status_timestamp"])
-    df = df.sort_values(by="status_timestamp")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["status_timestamp"] = pd.to_datetime(df["status_timestamp"])
+    with stage("sort"):
+        df = df.sort_values(by="status_timestamp")
     return df
 
 
+@instrumented
+@cached
 def order_events(
     client, start_time, end_time, strategy_name, database="strategy"
 ) -> pd.DataFrame:
@@ -42,35 +52,47 @@ def order_events(
     end_time = end_time.strftime("%Y-%m-%d %H:%M:%S")
     query = f"""SELECT * FROM {database}.unified_orders(strategy='{strategy_name}', start_ts='{start_time}', end_ts='{end_time}')"""
 
-    df = client.query_df(query)
-    df["event_ts"] = pd.to_datetime(df["event_ts"])
-    df = df.sort_values(by="event_ts")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["event_ts"] = pd.to_datetime(df["event_ts"])
+    with stage("sort"):
+        df = df.sort_values(by="event_ts")
     return df
 
 
+@instrumented
+@cached
 def lagged_returns(client, start_time, end_time, coin) -> pd.DataFrame:
     start_time = start_time.strftime("%Y-%m-%d %H:%M:%S")
     end_time = end_time.strftime("%Y-%m-%d %H:%M:%S")
     query = f"""SELECT * FROM tq.lagged_returns WHERE ts > '{start_time}' AND ts < '{end_time}' and coin = '{coin}'"""
-    df = client.query_df(query)
-    df["ts"] = pd.to_datetime(df["ts"])
-    df = df.sort_values(by="ts")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["ts"] = pd.to_datetime(df["ts"])
+    with stage("sort"):
+        df = df.sort_values(by="ts")
     return df
 
 
+@instrumented
+@cached
 def open_position_summary(
     client, start_time, end_time, coin, database="strategy"
 ) -> pd.DataFrame:
     start_time = start_time.strftime("%Y-%m-%d %H:%M:%S")
     end_time = end_time.strftime("%Y-%m-%d %H:%M:%S")
     query = f"""SELECT * FROM {database}.open_position_summary FINAL WHERE open_time > '{start_time}' AND open_time < '{end_time}' and coin = '{coin}'"""
-    df = client.query_df(query)
-    df["open_time"] = pd.to_datetime(df["open_time"])
-    df["capture_time"] = pd.to_datetime(df["capture_time"])
-    df = df.sort_values(by="capture_time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["open_time"] = pd.to_datetime(df["open_time"])
+        df["capture_time"] = pd.to_datetime(df["capture_time"])
+    with stage("sort"):
+        df = df.sort_values(by="capture_time")
     return df
 
 
+@instrumented
+@cached
 def info(
     client, start_time, end_time, strategy_name, database="strategy"
 ) -> pd.DataFrame:
@@ -80,12 +102,16 @@ def info(
         WHERE time > '{start_time}' AND time < '{end_time}' AND strategy_name = '{strategy_name}'
         ORDER BY time
         LIMIT 500000;"""
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
+@cached
 def fills(
     client,
     start_time: pd.Timestamp,
@@ -99,12 +125,16 @@ def fills(
             WHERE time > '{start_time}'
             AND time < '{end_time}'
             AND friendly_coin IN ( '{"', '".join(friendly_coins)}' )"""
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
+@cached
 def tq_trades(
     client,
     start_time: pd.Timestamp,
@@ -129,19 +159,23 @@ def tq_trades(
         query += f" AND address = '{address_filter}'"
     query += " ORDER BY time LIMIT 500000"
 
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df["px"] = df["px"].astype(float)
-    df["fee"] = df["fee"].astype(float)
-    df["sz"] = df["sz"].astype(float)
-    df["start_position"] = df["start_position"].astype(float)
-    df["closed_pnl"] = df["closed_pnl"].astype(float)
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+        df["px"] = df["px"].astype(float)
+        df["fee"] = df["fee"].astype(float)
+        df["sz"] = df["sz"].astype(float)
+        df["start_position"] = df["start_position"].astype(float)
+        df["closed_pnl"] = df["closed_pnl"].astype(float)
 
-    df = df.sort_values(by="time")
+    with stage("sort"):
+        df = df.sort_values(by="time")
 
     return df
 
 
+@instrumented
+@cached
 def minute_books(
     client,
     start_time: pd.Timestamp,
@@ -168,14 +202,18 @@ def minute_books(
                 LIMIT 1 BY (friendly_coin, time)
                 LIMIT {limit};"""
 
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df["bid_px"] = df["bid_px"].astype(float)
-    df["ask_px"] = df["ask_px"].astype(float)
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+        df["bid_px"] = df["bid_px"].astype(float)
+        df["ask_px"] = df["ask_px"].astype(float)
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
+@cached
 def minute_bbos(
     client, start_time: pd.Timestamp, end_time: pd.Timestamp, friendly_coins: list[str]
 ) -> pd.DataFrame:
@@ -195,12 +233,16 @@ def minute_bbos(
             ORDER BY time
             LIMIT 5000000;"""
 
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
+@cached
 def second_bbos(
     client, start_time: pd.Timestamp, end_time: pd.Timestamp, friendly_coins: list[str]
 ) -> pd.DataFrame:
@@ -220,12 +262,16 @@ def second_bbos(
             ORDER BY time
             LIMIT 5000000;"""
 
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
+@cached
 def minute_tobs(
     client, start_time: pd.Timestamp, end_time: pd.Timestamp, coins: list[str]
 ) -> pd.DataFrame:
@@ -246,15 +292,21 @@ def minute_tobs(
                     LIMIT 5000000
                     """
 
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df["bid_px"] = df["bid_px"].astype(float)
-    df["ask_px"] = df["ask_px"].astype(float)
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+        df["bid_px"] = df["bid_px"].astype(float)
+        df["ask_px"] = df["ask_px"].astype(float)
 
-    df = df.sort_values(by="time").drop_duplicates(subset=["time", "friendly_coin"])
+    with stage("sort"):
+        df = df.sort_values(by="time").drop_duplicates(
+            subset=["time", "friendly_coin"]
+        )
     return df
 
 
+@instrumented
+@cached
 def order_metas(
     client, start_time: pd.Timestamp, end_time: pd.Timestamp, strategies: list[str]
 ) -> pd.DataFrame:
@@ -273,12 +325,16 @@ def order_metas(
                     LIMIT 5000000
                     """
 
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
+@cached
 def tobs(
     client, start_time: pd.Timestamp, end_time: pd.Timestamp, friendly_coins: list[str]
 ) -> pd.DataFrame:
@@ -299,12 +355,16 @@ def tobs(
             LIMIT 1 by (friendly_coin, time)
             LIMIT 5000000;"""
 
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
+@cached
 def books(
     client,
     start_time: pd.Timestamp,
@@ -331,12 +391,16 @@ def books(
         LIMIT 1 BY (friendly_coin, time)
         LIMIT {limit};"""
 
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
+@cached
 def liquidation_observations(
     client, start_time, end_time, coin, pct_away=2, limit: int = 500000
 ):
@@ -350,11 +414,48 @@ def liquidation_observations(
             AND abs(pct_away) < {pct_away}
             ORDER BY observation_time DESC
             LIMIT {limit};"""
-    liqs = client.query_df(query)
-    liqs["ntl"] = abs(liqs["szi"] * liqs["liquidation_px"])
+    liqs = instrumentation.query_df(client, query)
+    with stage("convert"):
+        liqs["ntl"] = abs(liqs["szi"] * liqs["liquidation_px"])
     return liqs
 
 
+@instrumented
+@cached
+def liquidation_heatmap(
+    client,
+    start_time,
+    end_time,
+    coin,
+    pct_away=2,
+    time_bucket: str = "5min",
+    y_bucket: float = 0.05,
+    y: str = "pct_away",
+) -> pd.DataFrame:
+    start_time = start_time.strftime("%Y-%m-%d %H:%M:%S")
+    end_time = end_time.strftime("%Y-%m-%d %H:%M:%S")
+    bucket_s = int(pd.Timedelta(time_bucket).total_seconds())
+    query = f"""SELECT
+            toStartOfInterval(observation_time, INTERVAL {bucket_s} SECOND) AS observation_bucket,
+            round(floor(toFloat64({y}) / {y_bucket}) * {y_bucket}, 10) AS y_bucket,
+            sum(abs(toFloat64(szi) * toFloat64(liquidation_px))) AS ntl,
+            count() AS observations
+        FROM hyperliquid.nearby_liquidations
+            WHERE observation_time > '{start_time}'
+            AND observation_time < '{end_time}'
+            AND coin = '{coin}'
+            AND abs(pct_away) < {pct_away}
+            GROUP BY observation_bucket, y_bucket
+            ORDER BY observation_bucket, y_bucket;"""
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["observation_bucket"] = pd.to_datetime(df["observation_bucket"])
+    df.attrs.update(time_bucket=time_bucket, y_bucket=y_bucket)
+    return df
+
+
+@instrumented
+@cached
 def bbos(
     client,
     start_time: pd.Timestamp,
@@ -379,20 +480,24 @@ def bbos(
             LIMIT 1 by (friendly_coin, time)
             LIMIT 5000000;"""
 
-    df = client.query_df(query)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     if lags:
         df = add_lags(df, lags)
     return df
 
 
+@instrumented
 def perp_meta(client) -> dict[str, Any]:
-    return dict(
-        client.query_df("SELECT * FROM hyperliquid.perp_meta").set_index("name").T
-    )
+    df = instrumentation.query_df(client, "SELECT * FROM hyperliquid.perp_meta")
+    return dict(df.set_index("name").T)
 
 
+@instrumented
+@cached
 def trades(
     client,
     start_time: pd.Timestamp,
@@ -437,13 +542,17 @@ def trades(
         LIMIT 1 BY (friendly_coin, time, tid)
         LIMIT {limit};"""
 
-    df = client.query_df(query)
-    df["sign"] = df["side"].apply(lambda x: 1 if x == "B" else -1)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["sign"] = df["side"].apply(lambda x: 1 if x == "B" else -1)
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
+@cached
 def twap_trades(
     client,
     start_time: pd.Timestamp,
@@ -491,13 +600,16 @@ def twap_trades(
         LIMIT 7000000;
     """
 
-    df = client.query_df(query)
-    df["sign"] = df["side"].apply(lambda x: 1 if x == "B" else -1)
-    df["time"] = pd.to_datetime(df["time"])
-    df = df.sort_values(by="time")
+    df = instrumentation.query_df(client, query)
+    with stage("convert"):
+        df["sign"] = df["side"].apply(lambda x: 1 if x == "B" else -1)
+        df["time"] = pd.to_datetime(df["time"])
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
 def add_lags(bbos_df, lags):
     bbos_df["mid"] = (
         bbos_df["bid_px"].astype(float) + bbos_df["ask_px"].astype(float)
@@ -530,40 +642,45 @@ def add_lags(bbos_df, lags):
     return bbos_df
 
 
+@instrumented
 def backtest_fills(
     directory: str, coin_filter: list[str] | None = None, max_rows: int = 50000
 ) -> pd.DataFrame:
     file_path = os.path.join(directory, "fills.jsonl")
     fills_list = []
     row = 0
-    with open(file_path, "r") as f:
-        for line in f:
-            if row >= max_rows:
-                break
-            row += 1
-            data = json.loads(line.strip())
-            user = data.get("user")
-            for fill in data.get("fills", []):
-                fill_dict = fill.copy()
-                fill_dict["user"] = user
-                fills_list.append(fill_dict)
-    df = pd.DataFrame(fills_list)
+    with stage("decode"):
+        with open(file_path, "r") as f:
+            for line in f:
+                if row >= max_rows:
+                    break
+                row += 1
+                data = json.loads(line.strip())
+                user = data.get("user")
+                for fill in data.get("fills", []):
+                    fill_dict = fill.copy()
+                    fill_dict["user"] = user
+                    fills_list.append(fill_dict)
+        df = pd.DataFrame(fills_list)
     if df.empty:
         return df
-    df["time"] = pd.to_datetime(df["time"], unit="ms")
-    df["oid"] = df["oid"].astype("int64")
-    df["tid"] = df["tid"].astype("int64")
-    df["px"] = df["px"].astype(float)
-    df["sz"] = df["sz"].astype(float)
-    df["startPosition"] = df["startPosition"].astype(float)
-    df["closedPnl"] = df["closedPnl"].astype(float)
-    df["fee"] = df["fee"].astype(float)
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"], unit="ms")
+        df["oid"] = df["oid"].astype("int64")
+        df["tid"] = df["tid"].astype("int64")
+        df["px"] = df["px"].astype(float)
+        df["sz"] = df["sz"].astype(float)
+        df["startPosition"] = df["startPosition"].astype(float)
+        df["closedPnl"] = df["closedPnl"].astype(float)
+        df["fee"] = df["fee"].astype(float)
     if coin_filter:
         df = df[df["coin"].isin(coin_filter)]
-    df = df.sort_values(by="time")
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
 def backtest_orders(
     directory: str,
     coin_filter: list[str] | None = None,
@@ -577,102 +694,116 @@ def backtest_orders(
     # Read orders
     orders_list = []
     row = 0
-    with open(orders_file_path, "r") as f:
-        for line in f:
-            if row >= max_rows:
-                break
-            row += 1
-            data = json.loads(line.strip())
-            order_inner = data["order"]["order"]
-            order_dict = {
-                "address": data["address"],
-                "cloid": order_inner["cloid"],
-                "coin": order_inner["coin"],
-                "limit_px": float(order_inner["limitPx"]),
-                "oid": int(order_inner["oid"]),
-                "orig_sz": float(order_inner["origSz"]),
-                "side": order_inner["side"],
-                "sz": float(order_inner["sz"]),
-                "timestamp": int(order_inner["timestamp"]),
-                "status": data["order"]["status"],
-                "status_timestamp": int(data["order"]["statusTimestamp"]),
-            }
-            cloids.add(order_dict["cloid"])
-            orders_list.append(order_dict)
+    with stage("decode"):
+        with open(orders_file_path, "r") as f:
+            for line in f:
+                if row >= max_rows:
+                    break
+                row += 1
+                data = json.loads(line.strip())
+                order_inner = data["order"]["order"]
+                order_dict = {
+                    "address": data["address"],
+                    "cloid": order_inner["cloid"],
+                    "coin": order_inner["coin"],
+                    "limit_px": float(order_inner["limitPx"]),
+                    "oid": int(order_inner["oid"]),
+                    "orig_sz": float(order_inner["origSz"]),
+                    "side": order_inner["side"],
+                    "sz": float(order_inner["sz"]),
+                    "timestamp": int(order_inner["timestamp"]),
+                    "status": data["order"]["status"],
+                    "status_timestamp": int(data["order"]["statusTimestamp"]),
+                }
+                cloids.add(order_dict["cloid"])
+                orders_list.append(order_dict)
 
     if not orders_list:
         return pd.DataFrame()
 
-    df = pd.DataFrame(orders_list)
-    df["time"] = pd.to_datetime(df["timestamp"], unit="ms")
-    df["status_time"] = pd.to_datetime(df["status_timestamp"], unit="ms")
+    with stage("convert"):
+        df = pd.DataFrame(orders_list)
+        df["time"] = pd.to_datetime(df["timestamp"], unit="ms")
+        df["status_time"] = pd.to_datetime(df["status_timestamp"], unit="ms")
 
     if include_meta:
         meta_list = []
         row = 0
-        with open(order_meta_file_path, "r") as f:
-            for line in f:
-                data = json.loads(line.strip())
-                if data["cloid"] not in cloids:
-                    continue
-                if row >= max_rows:
-                    break
-                row += 1
-                float_dict = {k: v for k, v in data.get("float_values", [])}
-                timestamp_dict = {k: v for k, v in data.get("timestamp_values", [])}
-                string_dict = {k: v for k, v in data.get("string_values", [])}
-                data.update(float_dict)
-                data.update(timestamp_dict)
-                data.update(string_dict)
-                del data["float_values"]
-                del data["timestamp_values"]
-                del data["string_values"]
-                meta_list.append(data)
+        with stage("decode"):
+            with open(order_meta_file_path, "r") as f:
+                for line in f:
+                    data = json.loads(line.strip())
+                    if data["cloid"] not in cloids:
+                        continue
+                    if row >= max_rows:
+                        break
+                    row += 1
+                    float_dict = {k: v for k, v in data.get("float_values", [])}
+                    timestamp_dict = {
+                        k: v for k, v in data.get("timestamp_values", [])
+                    }
+                    string_dict = {k: v for k, v in data.get("string_values", [])}
+                    data.update(float_dict)
+                    data.update(timestamp_dict)
+                    data.update(string_dict)
+                    del data["float_values"]
+                    del data["timestamp_values"]
+                    del data["string_values"]
+                    meta_list.append(data)
         if meta_list:
-            df_meta = pd.DataFrame(meta_list)
-            df_meta["meta_time"] = pd.to_datetime(df_meta["time"], format="ISO8601")
+            with stage("convert"):
+                df_meta = pd.DataFrame(meta_list)
+                df_meta["meta_time"] = pd.to_datetime(
+                    df_meta["time"], format="ISO8601"
+                )
             df = pd.merge(df, df_meta, on="cloid", how="left", suffixes=("", "_meta"))
 
     if coin_filter:
         df = df[df["coin"].isin(coin_filter)]
-    df = df.sort_values(by="time")
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
 def backtest_strategy_info(
     directory: str, strategy_name_filter: list[str] | None = None, max_rows: int = 50000
 ) -> pd.DataFrame:
     file_path = os.path.join(directory, "strategy_info.jsonl")
     info_list = []
     row = 0
-    with open(file_path, "r") as f:
-        for line in f:
-            data = json.loads(line.strip())
-            if len(data) != 2:
-                continue
-            info_dict, strategy_name = data
-            if not info_dict:
-                continue
-            strategy_type = list(info_dict.keys())[0]
-            if strategy_name_filter is not None:
-                if strategy_name not in strategy_name_filter:
+    with stage("decode"):
+        with open(file_path, "r") as f:
+            for line in f:
+                data = json.loads(line.strip())
+                if len(data) != 2:
                     continue
-            inner = info_dict[strategy_type].copy()
-            inner["strategy_type"] = strategy_type
-            inner["strategy_name"] = strategy_name
-            info_list.append(inner)
-            row += 1
-            if row >= max_rows:
-                break
-
-    df = pd.DataFrame(info_list)
+                info_dict, strategy_name = data
+                if not info_dict:
+                    continue
+                strategy_type = list(info_dict.keys())[0]
+                if strategy_name_filter is not None:
+                    if strategy_name not in strategy_name_filter:
+                        continue
+                inner = info_dict[strategy_type].copy()
+                inner["strategy_type"] = strategy_type
+                inner["strategy_name"] = strategy_name
+                info_list.append(inner)
+                row += 1
+                if row >= max_rows:
+                    break
+
+        df = pd.DataFrame(info_list)
     if df.empty:
         return df
-    df["time"] = pd.to_datetime(df["time"], format="ISO8601")
-    df = df.sort_values(by="time")
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"], format="ISO8601")
+    with stage("sort"):
+        df = df.sort_values(by="time")
     return df
 
 
+@instrumented
 def backtest_theos(
     directory: str, coin_filter: list[str] | None = None, max_rows: int = 50000
 ) -> pd.DataFrame:
@@ -684,63 +815,74 @@ def backtest_theos(
     # Read and parse in chunks for better memory usage
     theos_list = []
     row = 0
-    with open(file_path, "r") as f:
-        for line in f:
-            if row >= max_rows:
-                break
+    with stage("decode"):
+        with open(file_path, "r") as f:
+            for line in f:
+                if row >= max_rows:
+                    break
 
-            # Parse JSON once
-            data = json.loads(line.strip())
+                # Parse JSON once
+                data = json.loads(line.strip())
 
-            # Early filtering with set lookup (O(1) vs O(n))
-            if coin_set and data.get("friendly_coin") not in coin_set:
-                continue
+                # Early filtering with set lookup (O(1) vs O(n))
+                if coin_set and data.get("friendly_coin") not in coin_set:
+                    continue
 
-            row += 1
+                row += 1
 
-            # More efficient dict update
-            if "float_values" in data:
-                float_dict = dict(data["float_values"])
-                del data["float_values"]
-                data.update(float_dict)
+                # More efficient dict update
+                if "float_values" in data:
+                    float_dict = dict(data["float_values"])
+                    del data["float_values"]
+                    data.update(float_dict)
 
-            theos_list.append(data)
+                theos_list.append(data)
 
     if not theos_list:
         return pd.DataFrame()
 
-    # Create DataFrame once with all data
-    df = pd.DataFrame(theos_list)
+    with stage("decode"):
+        # Create DataFrame once with all data
+        df = pd.DataFrame(theos_list)
 
     # Vectorized datetime conversion
-    df["time"] = pd.to_datetime(df["time"], unit="ns")
+    with stage("convert"):
+        df["time"] = pd.to_datetime(df["time"], unit="ns")
 
     # Sort and return
-    return df.sort_values(by="time")
+    with stage("sort"):
+        return df.sort_values(by="time")
 
 
+@instrumented
 def backtest_ws_requests(directory: str, max_rows: int = 50000) -> pd.DataFrame:
     file_path = os.path.join(directory, "ws_request.jsonl")
     requests_list = []
     row = 0
-    with open(file_path, "r") as f:
-        for line in f:
-            if row >= max_rows:
-                break
-            row += 1
-            data = json.loads(line.strip())
-            requests_list.append(data)
-    df = pd.DataFrame(requests_list)
+    with stage("decode"):
+        with open(file_path, "r") as f:
+            for line in f:
+                if row >= max_rows:
+                    break
+                row += 1
+                data = json.loads(line.strip())
+                requests_list.append(data)
+        df = pd.DataFrame(requests_list)
     if df.empty:
         return df
     if "response_capture_time" in df.columns:
-        df["response_capture_time"] = pd.to_datetime(
-            df["response_capture_time"], unit="ns"
-        )
-        df = df.sort_values(by="response_capture_time")
+        with stage("convert"):
+            df["response_capture_time"] = pd.to_datetime(
+                df["response_capture_time"], unit="ns"
+            )
+        with stage("sort"):
+            df = df.sort_values(by="response_capture_time")
     elif "submit_time" in df.columns:
-        df["submit_time"] = pd.to_datetime(df["submit_time"], unit="ns")
-        df = df.sort_values(by="submit_time")
+        with stage("convert"):
+            df["submit_time"] = pd.to_datetime(df["submit_time"], unit="ns")
+        with stage("sort"):
+            df = df.sort_values(by="submit_time")
     if "response" in df.columns:
-        df["response"] = df["response"].apply(json.loads)
+        with stage("decode"):
+            df["response"] = df["response"].apply(json.loads)
     return df
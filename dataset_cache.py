@@ -0,0 +1,438 @@
+"""Cross-kernel cache of fetched frames as memory-mapped Arrow IPC files.
+
+Every kernel on the box that enables the cache shares one directory (by
+default on ``/dev/shm``). A ``data_fetching`` call whose (function, coins,
+window, args) is already resident attaches to the mapped file instead of
+querying ClickHouse, so N kernels looking at the same window cost one fetch
+and one copy in memory. The fetching kernel attaches to the file it just wrote
+as well, so a hit and a miss return the same kind of frame.
+
+Frames map the file copy-on-write: numeric and datetime columns are views of
+the shared pages, and writing into one copies only the touched pages, privately
+to that kernel. Frames that would not come back from Arrow unchanged (nested
+list/dict columns, mixed object columns) are never cached. Any cache failure
+(permissions, a full ``/dev/shm``) warns and falls back to the plain fetch.
+
+Enable per process with ``enable()`` or for every kernel with the
+``VIZ_DATASET_CACHE`` environment variable (``1`` or a directory path). To share
+between analysts, give the directory a common group, ``enable(group=...)`` or
+``VIZ_DATASET_CACHE_GROUP``; everyone outside it is locked out.
+"""
+
+import datetime
+import base64
+import fcntl
+import functools
+import grp
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import tempfile
+import time
+import warnings
+import weakref
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from . import instrumentation
+from .instrumentation import stage
+
+DEFAULT_CAPACITY = 16 * 2**30
+# Windows ending this close to now are still being written to, never cache them
+MIN_AGE = pd.Timedelta("5min")
+# Group-only, setgid so files keep the directory's group, sticky so members
+# cannot delete or rename each other's files
+DIR_MODE = 0o3770
+FILE_MODE = 0o660
+
+_root: str | None = None
+_capacity = DEFAULT_CAPACITY
+
+
+def default_root() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "viz-datasets")
+
+
+def enable(
+    root: str | None = None,
+    capacity: int = DEFAULT_CAPACITY,
+    group: str | None = None,
+):
+    global _root, _capacity
+    import pyarrow  # noqa: F401, fail at enable time rather than on first fetch
+
+    root = root or default_root()
+    try:
+        os.mkdir(root, DIR_MODE)
+    except FileExistsError:
+        pass
+    else:
+        if group is not None:
+            os.chown(root, -1, grp.getgrnam(group).gr_gid)
+        # mkdir applies the umask, chmod does not
+        os.chmod(root, DIR_MODE)
+    if os.path.islink(root) or not os.path.isdir(root):
+        raise NotADirectoryError(f"{root} is not a directory")
+    _root = root
+    _capacity = capacity
+
+
+def disable():
+    global _root
+    _root = None
+
+
+def is_enabled() -> bool:
+    return _root is not None
+
+
+def _open_index() -> int:
+    # Never follows a planted symlink, and only a file this call created is
+    # chmodded
+    path = os.path.join(_root, "index.json")
+    try:
+        flags = os.O_RDWR | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW
+        fd = os.open(path, flags, FILE_MODE)
+    except FileExistsError:
+        return os.open(path, os.O_RDWR | os.O_NOFOLLOW)
+    os.fchmod(fd, FILE_MODE)
+    return fd
+
+
+@contextmanager
+def _locked_index():
+    # The index is rewritten in place under its own lock: in a sticky directory
+    # other users could not rename a replacement over it
+    with os.fdopen(_open_index(), "r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            index = json.loads(f.read() or "{}")
+        except json.JSONDecodeError:
+            index = {}
+        yield index
+        f.seek(0)
+        f.truncate()
+        json.dump(index, f)
+        f.flush()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _live_refs(entry: dict) -> int:
+    refs = {pid: n for pid, n in entry["refs"].items() if _pid_alive(int(pid))}
+    entry["refs"] = refs
+    return sum(refs.values())
+
+
+def _evict(index: dict, capacity: int):
+    total = sum(e["bytes"] for e in index.values())
+    for digest, entry in sorted(index.items(), key=lambda kv: kv[1]["last_access"]):
+        if total <= capacity:
+            break
+        if _live_refs(entry):
+            continue
+        if not _remove(digest):
+            continue
+        total -= entry["bytes"]
+        del index[digest]
+
+
+def _remove(digest: str) -> bool:
+    # Unlinking is safe even if a kernel still maps the file, the pages stay
+    # valid until its last reference is dropped. The sticky bit keeps other
+    # users' entries until their owner evicts them.
+    try:
+        os.remove(os.path.join(_root, f"{digest}.arrow"))
+    except FileNotFoundError:
+        pass
+    except PermissionError:
+        return False
+    return True
+
+
+def _release(root: str, digest: str, pid: str):
+    if _root != root:
+        return
+    try:
+        with _locked_index() as index:
+            entry = index.get(digest)
+            if entry is None or pid not in entry["refs"]:
+                return
+            entry["refs"][pid] -= 1
+            if entry["refs"][pid] <= 0:
+                del entry["refs"][pid]
+    except OSError:
+        # Dead-pid pruning reclaims the reference later
+        pass
+
+
+def _object_columns(schema) -> set[int]:
+    columns = schema.pandas_metadata["columns"]
+    return {i for i, c in enumerate(columns) if c["numpy_type"] == "object"}
+
+
+def _round_trips(df: pd.DataFrame, table) -> bool:
+    # Nested values come back as ndarrays or padded structs rather than the
+    # lists and dicts that went in, and object columns are only restored for
+    # strings, so anything else is left uncached
+    import pyarrow as pa
+
+    if any(pa.types.is_nested(field.type) for field in table.schema):
+        return False
+    for i in _object_columns(table.schema):
+        if i >= len(df.columns):
+            return False
+        kind = table.schema.field(i).type
+        if not (pa.types.is_string(kind) or pa.types.is_large_string(kind)):
+            return False
+    empty = table.slice(0, 0).to_pandas()
+    object_columns = _object_columns(table.schema)
+    return empty.index.dtype == df.index.dtype and all(
+        i in object_columns or restored == original
+        for i, (restored, original) in enumerate(zip(empty.dtypes, df.dtypes))
+    )
+
+
+def _writable_views(df: pd.DataFrame, table, buffer: mmap.mmap) -> pd.DataFrame:
+    # pyarrow hands out read-only views, rebuild them over the copy-on-write
+    # mapping so writes behave as on any other frame
+    base = np.frombuffer(buffer, dtype=np.uint8)
+    object_columns = _object_columns(table.schema)
+    columns = {}
+    for i, (_, col) in enumerate(df.items()):
+        if i in object_columns:
+            # pandas would hand these back as str dtype with NaN for None
+            values = table.column(i).to_numpy(zero_copy_only=False)
+            columns[i] = pd.Series(values, index=df.index, dtype=object, copy=False)
+            continue
+        if not isinstance(col.dtype, np.dtype):
+            # Strings and nullable types were converted onto the heap, tz-aware
+            # datetimes still view the mapping
+            shared = isinstance(col.dtype, pd.DatetimeTZDtype)
+            columns[i] = col.copy() if shared else col
+            continue
+        values = col.to_numpy()
+        if values.flags.c_contiguous and np.shares_memory(values, base):
+            offset = values.ctypes.data - base.ctypes.data
+            values = np.frombuffer(
+                buffer, dtype=values.dtype, count=len(values), offset=offset
+            )
+        columns[i] = pd.Series(values, index=df.index, copy=False)
+    out = pd.DataFrame(columns, index=df.index, copy=False)
+    out.columns = df.columns
+    out.attrs = df.attrs
+    return out
+
+
+def _attach(digest: str, hit: bool = True) -> tuple[pd.DataFrame, dict] | None:
+    import pyarrow as pa
+
+    path = os.path.join(_root, f"{digest}.arrow")
+    pid = str(os.getpid())
+    with _locked_index() as index:
+        entry = index.get(digest)
+        if entry is None or not os.path.exists(path):
+            index.pop(digest, None)
+            return None
+        entry["refs"][pid] = entry["refs"].get(pid, 0) + 1
+        entry["last_access"] = time.time()
+        entry["hits"] = entry.get("hits", 0) + int(hit)
+
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+        try:
+            buffer = mmap.mmap(fd, 0, access=mmap.ACCESS_COPY)
+        finally:
+            os.close(fd)
+        table = pa.ipc.open_file(pa.BufferReader(pa.py_buffer(buffer))).read_all()
+        df = _writable_views(table.to_pandas(split_blocks=True), table, buffer)
+    except BaseException:
+        _release(_root, digest, pid)
+        raise
+    weakref.finalize(df, _release, _root, digest, pid)
+    return df, entry
+
+
+def _store(digest: str, key: str, df: pd.DataFrame, record) -> bool:
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return False
+    if not _round_trips(df, table):
+        return False
+
+    path = os.path.join(_root, f"{digest}.arrow")
+    # mkstemp creates with O_EXCL, so a planted file or symlink is never reused
+    fd, tmp = tempfile.mkstemp(dir=_root, suffix=".tmp")
+    try:
+        os.fchmod(fd, FILE_MODE)
+        with os.fdopen(fd, "wb") as f, pa.PythonFile(f, mode="w") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    with _locked_index() as index:
+        index[digest] = {
+            "key": key,
+            "bytes": os.path.getsize(path),
+            "created": time.time(),
+            "last_access": time.time(),
+            "hits": 0,
+            "refs": {},
+            "limit": record.limit,
+            "hit_limit": record.hit_limit,
+        }
+        _evict(index, _capacity)
+    return True
+
+
+def _client_identity(client) -> dict:
+    # Entries from different servers, databases or users must never collide;
+    # the password stays out of the key, which is stored in the index
+    headers = getattr(client, "headers", None) or {}
+    user = headers.get("X-ClickHouse-User")
+    auth = headers.get("Authorization", "")
+    if user is None and auth.startswith("Basic "):
+        user = base64.b64decode(auth[6:]).decode(errors="replace").split(":", 1)[0]
+    return {
+        "url": getattr(client, "url", None),
+        "database": getattr(client, "database", None),
+        "user": user,
+    }
+
+
+def _normalize(value):
+    if isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date)):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, (list, tuple, set)):
+        return sorted(_normalize(v) for v in value)
+    return value
+
+
+def _too_recent(bound: inspect.BoundArguments) -> bool:
+    end_time = bound.arguments.get("end_time")
+    if end_time is None:
+        return False
+    end_time = pd.Timestamp(end_time)
+    if end_time.tzinfo is not None:
+        end_time = end_time.tz_convert(None)
+    now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+    return end_time > now - MIN_AGE
+
+
+def _hit(digest: str, name: str) -> pd.DataFrame | None:
+    with stage("attach"):
+        attached = _attach(digest)
+    if attached is None:
+        return None
+    df, entry = attached
+    if entry.get("hit_limit"):
+        with instrumentation.recording(name) as record:
+            record.limit, record.hit_limit = entry["limit"], True
+        instrumentation.warn_truncated(name, entry["limit"])
+    return df
+
+
+def cached(fn):
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(client, *args, **kwargs):
+        if _root is None:
+            return fn(client, *args, **kwargs)
+
+        bound = signature.bind(client, *args, **kwargs)
+        bound.apply_defaults()
+        if _too_recent(bound):
+            return fn(client, *args, **kwargs)
+        params = {k: _normalize(v) for k, v in bound.arguments.items() if k != "client"}
+        key = json.dumps(
+            [fn.__name__, _client_identity(client), params], sort_keys=True, default=str
+        )
+        digest = hashlib.sha1(key.encode()).hexdigest()
+
+        try:
+            df = _hit(digest, fn.__name__)
+        except OSError as e:
+            warnings.warn(f"dataset cache unavailable, fetching directly: {e}")
+            return fn(client, *args, **kwargs)
+        if df is not None:
+            return df
+
+        with instrumentation.recording(fn.__name__) as record:
+            df = fn(client, *args, **kwargs)
+        try:
+            if not _store(digest, key, df, record):
+                return df
+            # Hand back the mapped copy and let the heap frame go
+            with stage("attach"):
+                attached = _attach(digest, hit=False)
+        except OSError as e:
+            warnings.warn(f"not caching {fn.__name__}: {e}")
+            return df
+        return df if attached is None else attached[0]
+
+    return wrapper
+
+
+def stats() -> pd.DataFrame:
+    if _root is None:
+        return pd.DataFrame()
+    with _locked_index() as index:
+        rows = [
+            {
+                "digest": digest,
+                "key": entry["key"],
+                "bytes": entry["bytes"],
+                "refs": _live_refs(entry),
+                "hits": entry.get("hits", 0),
+                "hit_limit": entry.get("hit_limit", False),
+                "created": pd.Timestamp(entry["created"], unit="s"),
+                "last_access": pd.Timestamp(entry["last_access"], unit="s"),
+            }
+            for digest, entry in index.items()
+        ]
+    return pd.DataFrame(rows)
+
+
+def clear(force: bool = False):
+    if _root is None:
+        return
+    with _locked_index() as index:
+        if not force:
+            # Entries still attached in some kernel survive
+            _evict(index, 0)
+            return
+        for digest in list(index):
+            if _remove(digest):
+                del index[digest]
+
+
+_env = os.environ.get("VIZ_DATASET_CACHE")
+if _env:
+    try:
+        enable(
+            None if _env == "1" else _env,
+            group=os.environ.get("VIZ_DATASET_CACHE_GROUP"),
+        )
+    except OSError as e:
+        warnings.warn(f"VIZ_DATASET_CACHE set but the cache is unusable: {e}")
@@ -0,0 +1,280 @@
+"""Optional per-stage timing for the data_fetching functions.
+
+Nothing is recorded unless instrumentation is switched on, either globally
+with ``enable()`` or for a block with ``instrument()``::
+
+    with instrument(track_memory=True) as records:
+        df = data_fetching.bbos(client, start, end, ["BTC"])
+    summary(records)
+"""
+
+import contextvars
+import datetime
+import functools
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+import pandas as pd
+
+STAGES = ["attach", "query", "decode", "convert", "sort"]
+
+LOG: deque["FetchRecord"] = deque(maxlen=10000)
+
+_enabled = 0
+_track_memory = 0
+_collectors: list[list["FetchRecord"]] = []
+# tracemalloc is process-wide, fetch threads share one tracing session and
+# only the last tracker out stops it
+_tracing_lock = threading.Lock()
+_tracers = 0
+_started_tracing = False
+_current: contextvars.ContextVar["FetchRecord | None"] = contextvars.ContextVar(
+    "current_fetch_record", default=None
+)
+
+# Frames in these modules are wrappers around the user's call, truncation
+# warnings point past them
+_WRAPPER_FILES = {
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ("instrumentation.py", "dataset_cache.py", "data_fetching.py")
+}
+
+_LIMIT_RE = re.compile(r"LIMIT\s+(\d+)(?!\s*(?:\d|BY\b))", re.IGNORECASE)
+
+
+@dataclass
+class FetchRecord:
+    function: str
+    started: datetime.datetime
+    stages: dict[str, float] = field(default_factory=dict)
+    total_seconds: float = 0.0
+    rows: int | None = None
+    bytes: int | None = None
+    query_rows: int | None = None
+    limit: int | None = None
+    hit_limit: bool = False
+    peak_memory_delta: int | None = None
+    query: str | None = None
+    error: str | None = None
+
+
+def enable(track_memory: bool = False):
+    global _enabled, _track_memory
+    _enabled += 1
+    _track_memory += int(track_memory)
+
+
+def disable():
+    global _enabled, _track_memory
+    _enabled = 0
+    _track_memory = 0
+
+
+def is_enabled() -> bool:
+    return _enabled > 0
+
+
+@contextmanager
+def instrument(track_memory: bool = False):
+    global _enabled, _track_memory
+    records: list[FetchRecord] = []
+    _collectors.append(records)
+    _enabled += 1
+    _track_memory += int(track_memory)
+    try:
+        yield records
+    finally:
+        _enabled = max(_enabled - 1, 0)
+        _track_memory = max(_track_memory - int(track_memory), 0)
+        # By identity, an empty inner collector compares equal to an outer one
+        _collectors[:] = [c for c in _collectors if c is not records]
+
+
+@contextmanager
+def stage(name: str):
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.stages[name] = record.stages.get(name, 0.0) + time.perf_counter() - t0
+
+
+def query_limit(query: str) -> int | None:
+    limits = _LIMIT_RE.findall(query)
+    return int(limits[-1]) if limits else None
+
+
+@contextmanager
+def recording(function: str):
+    # Yields the active record, or a detached one when instrumentation is off,
+    # so callers such as dataset_cache can see hit_limit either way
+    record = _current.get()
+    if record is not None:
+        yield record
+        return
+    record = FetchRecord(function=function, started=datetime.datetime.now())
+    token = _current.set(record)
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+
+
+def _caller_stacklevel() -> int:
+    frame = sys._getframe(1)
+    level = 0
+    while frame is not None and frame.f_code.co_filename in _WRAPPER_FILES:
+        frame = frame.f_back
+        level += 1
+    # warnings counts the frame calling warn() as 1
+    return level + 1
+
+
+def warn_truncated(function: str, limit: int):
+    warnings.warn(
+        f"{function} returned exactly LIMIT {limit} rows, "
+        "the result is probably truncated",
+        stacklevel=_caller_stacklevel(),
+    )
+
+
+def query_df(client, query: str) -> pd.DataFrame:
+    record = _current.get()
+    if record is None:
+        return client.query_df(query)
+
+    with stage("query"):
+        df = client.query_df(query)
+    record.query = query
+    record.query_rows = len(df)
+    record.limit = query_limit(query)
+    if record.limit is not None and record.query_rows == record.limit:
+        record.hit_limit = True
+        warn_truncated(record.function, record.limit)
+    return df
+
+
+def _result_size(result: Any) -> tuple[int | None, int | None]:
+    if isinstance(result, pd.DataFrame):
+        return len(result), int(result.memory_usage(index=True, deep=False).sum())
+    if isinstance(result, dict):
+        return len(result), None
+    return None, None
+
+
+def _start_tracking() -> int:
+    global _tracers, _started_tracing
+    with _tracing_lock:
+        if _tracers == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+            # With concurrent fetches the peak is shared, only reset it when no
+            # other thread is measuring
+            tracemalloc.reset_peak()
+        _tracers += 1
+        mem_before, _ = tracemalloc.get_traced_memory()
+    return mem_before
+
+
+def _stop_tracking(mem_before: int) -> int:
+    global _tracers, _started_tracing
+    with _tracing_lock:
+        _, peak = tracemalloc.get_traced_memory()
+        _tracers -= 1
+        if _tracers == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+    return peak - mem_before
+
+
+def instrumented(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return fn(*args, **kwargs)
+
+        record = FetchRecord(function=fn.__name__, started=datetime.datetime.now())
+        # Only the outermost call owns the tracemalloc peak, nested calls would
+        # reset it under their caller.
+        track_memory = _track_memory > 0 and _current.get() is None
+        if track_memory:
+            mem_before = _start_tracking()
+
+        token = _current.set(record)
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.total_seconds = time.perf_counter() - t0
+            _current.reset(token)
+            if track_memory:
+                record.peak_memory_delta = _stop_tracking(mem_before)
+            LOG.append(record)
+            for records in _collectors:
+                records.append(record)
+
+        record.rows, record.bytes = _result_size(result)
+        return result
+
+    return wrapper
+
+
+def fetch_log() -> list[FetchRecord]:
+    return list(LOG)
+
+
+def clear_log():
+    LOG.clear()
+
+
+def summary(
+    records: list[FetchRecord] | None = None, by_function: bool = False
+) -> pd.DataFrame:
+    records = fetch_log() if records is None else records
+    rows = []
+    for r in records:
+        row = {
+            "function": r.function,
+            "started": r.started,
+            "total_seconds": r.total_seconds,
+        }
+        for name in STAGES:
+            row[f"{name}_seconds"] = r.stages.get(name, 0.0)
+        row["other_seconds"] = r.total_seconds - sum(r.stages.values())
+        row.update(
+            rows=r.rows,
+            bytes=r.bytes,
+            query_rows=r.query_rows,
+            limit=r.limit,
+            hit_limit=r.hit_limit,
+            peak_memory_delta=r.peak_memory_delta,
+            error=r.error,
+        )
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    if not by_function or df.empty:
+        return df
+
+    seconds = [c for c in df.columns if c.endswith("_seconds")]
+    agg = df.groupby("function")[seconds + ["rows", "bytes"]].sum()
+    agg.insert(0, "calls", df.groupby("function").size())
+    agg["hit_limit"] = df.groupby("function")["hit_limit"].sum()
+    agg["max_peak_memory_delta"] = df.groupby("function")["peak_memory_delta"].max()
+    return agg.sort_values(by="total_seconds", ascending=False).reset_index()
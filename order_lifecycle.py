@@ -0,0 +1,201 @@
+"""Per-order lifecycle and latency reconstruction.
+
+Works on ``orders``, ``order_events``, ``backtest_orders`` and
+``backtest_ws_requests`` output. Events are sorted by (order id, time) once and
+every per-order quantity is derived from group boundaries with ``reduceat``
+and shifted comparisons instead of a groupby-apply.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .alignment import _NAT, _to_ns
+
+_MAX = np.iinfo(np.int64).max
+
+OPEN_STATUSES = {"open", "triggered"}
+TIME_COLUMNS = ["status_time", "event_ts", "status_timestamp"]
+LATENCY_BINS_MS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, np.inf]
+
+
+def _time_col(df: pd.DataFrame, time_col: str | None) -> str:
+    if time_col is not None:
+        return time_col
+    for col in TIME_COLUMNS:
+        if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col]):
+            return col
+    raise KeyError(f"no event time column, expected one of {TIME_COLUMNS}")
+
+
+def _present(df: pd.DataFrame, cols) -> list[str]:
+    if isinstance(cols, str):
+        cols = [cols]
+    return [c for c in cols or [] if c in df.columns]
+
+
+def _group_reduce(ufunc, values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    if not len(values):
+        return values[:0]
+    return ufunc.reduceat(values, starts)
+
+
+def _sorted_events(df: pd.DataFrame, id_col: str, time_col: str):
+    df = df[df[id_col].notna()]
+    codes, _ = pd.factorize(df[id_col])
+    t = _to_ns(df[time_col])
+    order = np.lexsort((t, codes))
+    df = df.iloc[order]
+    codes, t = codes[order], t[order]
+    new_group = np.ones(len(codes), dtype=bool)
+    new_group[1:] = codes[1:] != codes[:-1]
+    return df, t, new_group
+
+
+def order_summary(
+    events: pd.DataFrame,
+    id_col: str = "oid",
+    time_col: str | None = None,
+    status_col: str = "status",
+    placed_col: str = "time",
+    by: tuple[str, ...] = ("strategy_name", "address", "coin", "side"),
+) -> pd.DataFrame:
+    time_col = _time_col(events, time_col)
+    df, t, new_group = _sorted_events(events, id_col, time_col)
+    starts = np.flatnonzero(new_group)
+    ends = np.append(starts[1:], len(df))[: len(starts)] - 1
+    n_events = ends - starts + 1
+
+    status = df[status_col].astype(str).to_numpy()
+    out = {id_col: df[id_col].to_numpy()[starts]}
+    for col in _present(df, by):
+        out[col] = df[col].to_numpy()[starts]
+
+    if placed_col in df.columns and placed_col != time_col:
+        placed = _to_ns(df[placed_col])
+        placed = np.where(placed == _NAT, _MAX, placed)
+        placed = _group_reduce(np.minimum, placed, starts)
+    else:
+        placed = t[starts]
+    is_open = np.isin(status, list(OPEN_STATUSES))
+    ack = _group_reduce(np.minimum, np.where(is_open, t, _MAX), starts)
+    terminal = ~np.isin(status[ends], list(OPEN_STATUSES))
+    done = np.where(terminal, t[ends], _MAX)
+
+    def as_time(ns):
+        return np.where(ns == _MAX, _NAT, ns).view("datetime64[ns]")
+
+    out["placed_time"] = as_time(placed)
+    out["ack_time"] = as_time(ack)
+    out["final_time"] = as_time(done)
+    out["final_status"] = status[ends]
+    out["n_events"] = n_events
+
+    with np.errstate(invalid="ignore"):
+        out["ack_latency_ms"] = np.where(
+            (ack != _MAX) & (placed != _MAX), (ack - placed) / 1e6, np.nan
+        )
+        rest_from = np.where(ack != _MAX, ack, placed)
+        out["resting_ms"] = np.where(
+            terminal & (rest_from != _MAX), (done - rest_from) / 1e6, np.nan
+        )
+
+    if "orig_sz" in df.columns and "sz" in df.columns:
+        sz = df["sz"].to_numpy(dtype=float)
+        orig_sz = df["orig_sz"].to_numpy(dtype=float)[starts]
+        min_sz = _group_reduce(np.fmin, sz, starts)
+        filled = np.where(status[ends] == "filled", orig_sz, orig_sz - min_sz)
+        shrank = np.zeros(len(sz), dtype=bool)
+        shrank[1:] = (sz[1:] < sz[:-1]) & ~new_group[1:] & is_open[1:]
+        out["orig_sz"] = orig_sz
+        out["filled_sz"] = filled
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out["fill_ratio"] = filled / orig_sz
+        out["n_partial_fills"] = _group_reduce(np.add, shrank.astype(np.int64), starts)
+
+    return pd.DataFrame(out)
+
+
+def status_transitions(
+    events: pd.DataFrame,
+    id_col: str = "oid",
+    time_col: str | None = None,
+    status_col: str = "status",
+) -> pd.DataFrame:
+    time_col = _time_col(events, time_col)
+    df, t, new_group = _sorted_events(events, id_col, time_col)
+    status = df[status_col].astype(str).to_numpy()
+    prev = np.flatnonzero(~new_group) - 1
+    cur = prev + 1
+    transitions = pd.DataFrame(
+        {
+            "from_status": status[prev],
+            "to_status": status[cur],
+            "dt_ms": (t[cur] - t[prev]) / 1e6,
+        }
+    )
+    grouped = transitions.groupby(["from_status", "to_status"])["dt_ms"]
+    return grouped.agg(
+        count="size",
+        median_ms="median",
+        p90_ms=lambda x: x.quantile(0.9),
+    ).reset_index()
+
+
+def request_latencies(
+    ws_requests: pd.DataFrame,
+    submit_col: str = "submit_time",
+    response_col: str = "response_capture_time",
+) -> pd.DataFrame:
+    df = ws_requests.copy()
+    for col in (submit_col, response_col):
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], unit="ns")
+    df["latency_ms"] = (_to_ns(df[response_col]) - _to_ns(df[submit_col])) / 1e6
+    missing = df[submit_col].isna() | df[response_col].isna()
+    df.loc[missing, "latency_ms"] = np.nan
+    return df
+
+
+def latency_summary(
+    df: pd.DataFrame,
+    value_col: str = "latency_ms",
+    by: tuple[str, ...] = ("strategy_name", "coin"),
+) -> pd.DataFrame:
+    by = _present(df, by)
+    percentiles = [0.5, 0.9, 0.99]
+    if not by:
+        return df[value_col].describe(percentiles=percentiles).to_frame().T
+    return df.groupby(by)[value_col].describe(percentiles=percentiles).reset_index()
+
+
+def latency_histogram(
+    df: pd.DataFrame,
+    value_col: str = "latency_ms",
+    by: tuple[str, ...] = ("strategy_name", "coin"),
+    bins: list[float] = LATENCY_BINS_MS,
+) -> pd.DataFrame:
+    by = _present(df, by)
+    values = df[value_col].to_numpy(dtype=float)
+    ok = ~np.isnan(values)
+    bins = np.asarray(bins, dtype=float)
+    # Below the first edge (negative latency from clock skew) gets its own bin
+    # rather than being folded into the first one
+    idx = np.searchsorted(bins, values[ok], side="right")
+    idx = np.minimum(idx, len(bins) - 1)
+    below = int((idx == 0).sum())
+    if below:
+        warnings.warn(
+            f"{below} {value_col} values below {bins[0]:g}, check for clock skew",
+            stacklevel=2,
+        )
+    labels = [f"< {bins[0]:g}"]
+    labels += [f"[{bins[i]:g}, {bins[i + 1]:g})" for i in range(len(bins) - 1)]
+    binned = pd.Categorical.from_codes(idx, categories=labels, ordered=True)
+
+    if not by:
+        return pd.Series(binned).value_counts(sort=False).to_frame().T
+    frame = df.loc[ok, by].assign(bin=binned)
+    hist = frame.groupby(by + ["bin"], observed=False).size()
+    return hist.unstack("bin", fill_value=0).reset_index()
@@ -1,17 +1,91 @@
-from bokeh.models import ColumnDataSource, HoverTool
+from collections import OrderedDict
+import hashlib
+
+from bokeh.models import (
+    ColorBar,
+    ColumnDataSource,
+    HoverTool,
+    LinearColorMapper,
+    LogColorMapper,
+)
 from bokeh.palettes import Category20
 import numpy as np
+import pandas as pd
 
+# Theo/feature stacks keyed on a hash of the whole input frame, so re-rendering
+# the same frame with different figure options skips the transforms. Only that
+# helper is memoized: for fills and theo + lean the full-frame hash costs as
+# much as the transform. Bounded by bytes so cached column dicts never pin more
+# than CACHE_MAXBYTES.
+CACHE_MAXBYTES = 256 * 2**20
+_cache: OrderedDict = OrderedDict()
+_cache_bytes = 0
 
-def add_fills_to_fig(fig, fills_df):
-    fills_df = fills_df.copy()
 
-    fills_df["color"] = fills_df["side"].map({"B": "blue", "A": "red"})
-    fills_df["angle"] = fills_df["side"].map({"B": 0, "A": 3.14})
-    fills_df["plot_size"] = np.clip(
-        np.sqrt(fills_df["sz"] * fills_df["px"]) / np.sqrt(1000) * 10, 3, 20
+def clear_cache():
+    global _cache_bytes
+    _cache.clear()
+    _cache_bytes = 0
+
+
+def _fingerprint(df):
+    try:
+        hashed = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    except TypeError:
+        return None
+    return (
+        len(df),
+        tuple(df.columns),
+        tuple(str(dtype) for dtype in df.dtypes),
+        hashlib.blake2b(hashed.tobytes(), digest_size=16).hexdigest(),
     )
-    fills_source = ColumnDataSource(fills_df)
+
+
+def _nbytes(value):
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    if getattr(value, "dtype", None) == object:
+        # nbytes only counts the pointers, not the strings they point at
+        return int(pd.Series(value, copy=False).memory_usage(index=False, deep=True))
+    return getattr(value, "nbytes", 0)
+
+
+def _memoized(name, df, args, compute):
+    global _cache_bytes
+    fingerprint = _fingerprint(df)
+    if fingerprint is None:
+        return compute()
+    key = (name, fingerprint, args)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key][0]
+    value = compute()
+    size = _nbytes(value)
+    if size > CACHE_MAXBYTES:
+        return value
+    _cache[key] = (value, size)
+    _cache_bytes += size
+    while _cache_bytes > CACHE_MAXBYTES:
+        _, (_, evicted) = _cache.popitem(last=False)
+        _cache_bytes -= evicted
+    return value
+
+
+def _fills_data(fills_df):
+    data = ColumnDataSource.from_df(fills_df)
+    side = fills_df["side"]
+    data["color"] = side.map({"B": "blue", "A": "red"}).to_numpy()
+    data["angle"] = side.map({"B": 0, "A": 3.14}).to_numpy()
+    data["plot_size"] = np.clip(
+        np.sqrt(fills_df["sz"] * fills_df["px"]) / np.sqrt(1000) * 10, 3, 20
+    ).to_numpy()
+    return data
+
+
+def add_fills_to_fig(fig, fills_df):
+    fills_source = ColumnDataSource(data=_fills_data(fills_df))
 
     renderer = fig.scatter(
         x="time",
@@ -41,17 +115,25 @@ def add_fills_to_fig(fig, fills_df):
     return fig
 
 
-def add_theo_with_lean_to_fig(fig, info_df):
-    info_df = info_df.copy()
+def _theo_with_lean_data(info_df):
+    info_df = info_df[["time", "strategy_name", "theo", "lean_bps"]].copy()
     info_df["theo_with_lean"] = info_df["theo"] * (1 + info_df["lean_bps"] / 10000)
     info_df = info_df.sort_values(by="time")[
         ["time", "theo_with_lean", "strategy_name", "theo"]
     ]
+    return [
+        (strategy_name, ColumnDataSource.from_df(group))
+        for strategy_name, group in info_df.groupby("strategy_name", sort=False)
+    ]
+
+
+def add_theo_with_lean_to_fig(fig, info_df):
     colors = Category20[20]
 
-    for strategy_name, color in zip(info_df.strategy_name.unique(), colors):
-        info_df_strategy = info_df[info_df["strategy_name"] == strategy_name]
-        info_data_source = ColumnDataSource(info_df_strategy)
+    for (strategy_name, strategy_data), color in zip(
+        _theo_with_lean_data(info_df), colors
+    ):
+        info_data_source = ColumnDataSource(data=strategy_data)
 
         fig.step(
             x="time",
@@ -65,17 +147,11 @@ def add_theo_with_lean_to_fig(fig, info_df):
     return fig
 
 
-def add_theo_and_features_to_fig(
-    fig, theo_df, feature_names, include_features=True, spot_label=False
-):
-    theo_df = theo_df.copy()
-
+def _theo_and_features_data(theo_df, feature_names, include_features):
     theo_df = theo_df.sort_values(by="time")
     theo_df["next_time"] = theo_df["time"].shift(-1)
 
     if include_features:
-        colors = Category20[20]
-
         for feat in feature_names:
             theo_df[f"{feat}+"] = theo_df[feat].clip(lower=0)
             theo_df[f"{feat}-"] = theo_df[feat].clip(upper=0)
@@ -95,7 +171,20 @@ def add_theo_and_features_to_fig(
         # Compute lean and theo + lean
         theo_df["lean"] = theo_df[feature_names].sum(axis=1)
 
-    theo_data_source = ColumnDataSource(data=theo_df)
+    return ColumnDataSource.from_df(theo_df)
+
+
+def add_theo_and_features_to_fig(
+    fig, theo_df, feature_names, include_features=True, spot_label=False
+):
+    data = _memoized(
+        "theo_and_features",
+        theo_df,
+        (tuple(feature_names), include_features),
+        lambda: _theo_and_features_data(theo_df, feature_names, include_features),
+    )
+    theo_data_source = ColumnDataSource(data=dict(data))
+    colors = Category20[20]
 
     fig.step(
         x="time",
@@ -148,3 +237,102 @@ def add_theo_and_features_to_fig(
             )
 
     return fig
+
+
+def bin_liquidations(
+    liqs: pd.DataFrame,
+    time_bucket: str = "5min",
+    y_bucket: float = 0.05,
+    y: str = "pct_away",
+) -> pd.DataFrame:
+    # Client-side equivalent of data_fetching.liquidation_heatmap for
+    # liquidation_observations output
+    y_values = liqs[y].to_numpy(dtype=float)
+    ok = np.isfinite(y_values) & liqs["observation_time"].notna().to_numpy()
+    liqs, y_values = liqs[ok], y_values[ok]
+    times = pd.to_datetime(liqs["observation_time"]).dt.floor(time_bucket)
+    t_codes, t_buckets = pd.factorize(times, sort=True)
+    y_codes = np.floor(y_values / y_bucket).astype(np.int64)
+    y_min = y_codes.min(initial=0)
+    ny = y_codes.max(initial=0) - y_min + 1
+
+    flat = t_codes * ny + (y_codes - y_min)
+    size = len(t_buckets) * ny
+    ntl = np.bincount(flat, weights=liqs["ntl"].to_numpy(dtype=float), minlength=size)
+    observations = np.bincount(flat, minlength=size)
+
+    cells = np.flatnonzero(observations)
+    df = pd.DataFrame(
+        {
+            "observation_bucket": t_buckets[cells // ny],
+            "y_bucket": np.round((cells % ny + y_min) * y_bucket, 10),
+            "ntl": ntl[cells],
+            "observations": observations[cells],
+        }
+    )
+    df.attrs.update(time_bucket=time_bucket, y_bucket=y_bucket)
+    return df
+
+
+def _bucket_width(heatmap_df, col, default):
+    # Bucket sizes travel in attrs, the smallest gap between buckets is the
+    # fallback for frames that lost them
+    if col in heatmap_df.attrs:
+        return heatmap_df.attrs[col]
+    key = "observation_bucket" if col == "time_bucket" else "y_bucket"
+    gaps = np.diff(np.unique(heatmap_df[key].to_numpy()))
+    if not len(gaps):
+        return default
+    return pd.Timedelta(gaps.min()) if col == "time_bucket" else float(gaps.min())
+
+
+def add_liquidation_heatmap_to_fig(
+    fig,
+    heatmap_df,
+    palette="Viridis256",
+    log_scale=False,
+):
+    if heatmap_df.empty:
+        return fig
+
+    bucket = pd.Timedelta(_bucket_width(heatmap_df, "time_bucket", "5min"))
+    y_bucket = _bucket_width(heatmap_df, "y_bucket", 0.05)
+    t0 = heatmap_df["observation_bucket"].min()
+    y0 = heatmap_df["y_bucket"].min()
+    t_idx = ((heatmap_df["observation_bucket"] - t0) / bucket).round().astype(int)
+    y_idx = ((heatmap_df["y_bucket"] - y0) / y_bucket).round().astype(int)
+
+    grid = np.zeros((y_idx.max() + 1, t_idx.max() + 1))
+    np.add.at(grid, (y_idx.to_numpy(), t_idx.to_numpy()), heatmap_df["ntl"].to_numpy())
+    grid[grid == 0] = np.nan
+
+    mapper_cls = LogColorMapper if log_scale else LinearColorMapper
+    mapper = mapper_cls(
+        palette=palette,
+        low=np.nanmin(grid) if log_scale else 0,
+        high=np.nanmax(grid),
+        nan_color=(0, 0, 0, 0),
+    )
+    renderer = fig.image(
+        image=[grid],
+        x=t0.value / 1e6,
+        y=y0,
+        dw=grid.shape[1] * bucket.value / 1e6,
+        dh=grid.shape[0] * y_bucket,
+        color_mapper=mapper,
+        level="image",
+    )
+    fig.add_tools(
+        HoverTool(
+            renderers=[renderer],
+            tooltips=[
+                ("time", "$x{%F %T}"),
+                ("bucket", "$y{0.00}"),
+                ("ntl", "@image{0,0}"),
+            ],
+            formatters={"$x": "datetime"},
+        )
+    )
+    fig.add_layout(ColorBar(color_mapper=mapper, title="ntl"), "right")
+
+    return fig
@@ -0,0 +1,184 @@
+"""Position and PnL curves from ``tq_trades``, ``fills`` and ``backtest_fills``.
+
+Realized PnL is taken from the exchange's closed pnl, so average entry and
+unrealized PnL follow from cash flow alone and the whole curve is a handful of
+grouped cumulative sums, with no per-fill loop. Fills without a closed pnl or
+fee column are rejected rather than treated as zero.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .alignment import AsofIndex, bbo_index
+
+ALIASES = {
+    "start_position": ["start_position", "startPosition"],
+    "closed_pnl": ["closed_pnl", "closedPnl"],
+    "fee": ["fee"],
+}
+ACCOUNT_COLUMNS = ["address", "user", "strategy", "strategy_name"]
+COIN_COLUMNS = ["coin", "friendly_coin"]
+# bbo_index is keyed on friendly_coin, which differs from coin for spot
+MARK_KEY = "friendly_coin"
+
+
+def _first_present(df: pd.DataFrame, candidates: list[str]) -> str | None:
+    return next((c for c in candidates if c in df.columns), None)
+
+
+def _required(df: pd.DataFrame, name: str) -> np.ndarray:
+    col = _first_present(df, ALIASES[name])
+    if col is None:
+        raise KeyError(f"fills have no {name} column, expected one of {ALIASES[name]}")
+    return df[col].to_numpy(dtype=float)
+
+
+def _group_cumsum(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    total = np.cumsum(values)
+    before = np.concatenate([[0.0], total])[starts]
+    lengths = np.diff(np.append(starts, len(values)))
+    return total - np.repeat(before, lengths)
+
+
+def pnl_curve(
+    fills_df: pd.DataFrame,
+    marks: "AsofIndex | pd.DataFrame | None" = None,
+    by: list[str] | None = None,
+    coin_col: str | None = None,
+    time_col: str = "time",
+) -> pd.DataFrame:
+    coin_col = coin_col or _first_present(fills_df, COIN_COLUMNS)
+    if by is None:
+        account = _first_present(fills_df, ACCOUNT_COLUMNS)
+        by = [account, coin_col] if account else [coin_col]
+
+    df = fills_df.sort_values(by=by + [time_col], kind="stable")
+    codes = df.groupby(by, sort=False).ngroup().to_numpy()
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+
+    px = df["px"].to_numpy(dtype=float)
+    sz = df["sz"].to_numpy(dtype=float)
+    if "sign" in df.columns:
+        sign = df["sign"].to_numpy(dtype=float)
+    else:
+        sign = np.where(df["side"].to_numpy() == "B", 1.0, -1.0)
+    signed = sign * sz
+
+    start_col = _first_present(df, ALIASES["start_position"])
+    if start_col is not None:
+        start_position = df[start_col].to_numpy(dtype=float)
+        position = start_position + signed
+        opening = start_position[starts]
+    else:
+        position = _group_cumsum(signed, starts)
+        opening = np.zeros(len(starts))
+
+    # Inventory held before the first fill is assumed entered at that fill's px
+    opening_cash = np.zeros(len(df))
+    opening_cash[starts] = -opening * px[starts]
+    cash = _group_cumsum(opening_cash - signed * px, starts)
+
+    realized = _group_cumsum(_required(df, "closed_pnl"), starts)
+    fees = _group_cumsum(_required(df, "fee"), starts)
+
+    keep = [time_col] + by
+    if MARK_KEY in df.columns and MARK_KEY not in by:
+        keep.append(MARK_KEY)
+    out = df[keep].copy()
+    out["px"] = px
+    out["signed_sz"] = signed
+    out["position"] = position
+    out["cash"] = cash
+    out["realized_pnl"] = realized
+    out["fees"] = fees
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out["avg_entry"] = np.where(
+            np.isclose(position, 0), np.nan, (realized - cash) / position
+        )
+
+    if marks is None:
+        mark = px
+    else:
+        key_col = MARK_KEY if MARK_KEY in df.columns else coin_col
+        keys, times = df[key_col].to_numpy(), df[time_col].to_numpy()
+        mark = _lookup_marks(marks, keys, times, px)
+    _mark_to_market(out, mark)
+    return out.reset_index(drop=True)
+
+
+def _lookup_marks(
+    marks, keys: np.ndarray, times: np.ndarray, fallback: np.ndarray
+) -> np.ndarray:
+    if not isinstance(marks, AsofIndex):
+        marks = bbo_index(marks)
+    mark = marks.lookup(keys, times, ["mid"])["mid"]
+    missing = np.isnan(mark)
+    if len(mark) and missing.mean() > 0.5:
+        warnings.warn(
+            f"no mark for {missing.sum()} of {len(mark)} rows, using fill px; "
+            f"are marks keyed on {MARK_KEY}?",
+            stacklevel=3,
+        )
+    return np.where(missing, fallback, mark)
+
+
+def _mark_to_market(curve: pd.DataFrame, mark: np.ndarray):
+    position = curve["position"].to_numpy()
+    unrealized = curve["cash"].to_numpy() - curve["realized_pnl"].to_numpy()
+    unrealized = unrealized + position * mark
+    curve["mark"] = mark
+    curve["unrealized_pnl"] = np.where(np.isclose(position, 0), 0.0, unrealized)
+    curve["total_pnl"] = curve["realized_pnl"] + curve["unrealized_pnl"] - curve["fees"]
+
+
+def resample_pnl(
+    curve: pd.DataFrame,
+    freq: str = "1min",
+    marks: "AsofIndex | pd.DataFrame | None" = None,
+    by: list[str] | None = None,
+    coin_col: str | None = None,
+    end_time: pd.Timestamp | None = None,
+    time_col: str = "time",
+) -> pd.DataFrame:
+    coin_col = coin_col or _first_present(curve, COIN_COLUMNS)
+    if by is None:
+        by = [c for c in curve.columns if c in ACCOUNT_COLUMNS] + [coin_col]
+
+    group_id = curve.groupby(by, sort=False).ngroup().to_numpy()
+    state = AsofIndex(
+        curve.assign(_group=group_id),
+        columns=["position", "cash", "realized_pnl", "fees", "px"],
+        time_col=time_col,
+        by="_group",
+    )
+
+    step = pd.Timedelta(freq)
+    first = curve.groupby(group_id, sort=True)[time_col].min()
+    last = curve[time_col].max() if end_time is None else pd.Timestamp(end_time)
+    # Bars are labelled by their end, matching minute_bbos/second_bbos
+    bar_start = first.dt.floor(freq) + step
+    bar_end = last.ceil(freq)
+    counts = np.maximum(((bar_end - bar_start) // step) + 1, 0).to_numpy()
+    groups = np.repeat(first.index.to_numpy(), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    bar_times = np.repeat(bar_start.to_numpy(), counts) + offsets * step.to_numpy()
+
+    values = state.lookup(groups, bar_times)
+    key_col = MARK_KEY if MARK_KEY in curve.columns else coin_col
+    key_cols = list(dict.fromkeys(by + [key_col]))
+    keys = curve.groupby(group_id, sort=True)[key_cols].first()
+    out = keys.loc[groups].reset_index(drop=True)
+    out.insert(0, time_col, bar_times)
+    for col, arr in values.items():
+        out[col] = arr
+
+    if marks is None:
+        mark = out["px"].to_numpy()
+    else:
+        keys = out[key_col].to_numpy()
+        mark = _lookup_marks(marks, keys, bar_times, out["px"].to_numpy())
+    out = out.drop(columns=["px"])
+    _mark_to_market(out, mark)
+    return out
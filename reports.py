@@ -0,0 +1,238 @@
+"""Headless batch rendering of the standard strategy figures to HTML.
+
+    python -m viz report --start 2025-01-01 --end 2025-01-02 --coins BTC ETH \\
+        --strategies mm_a mm_b --backtests runs/bt_1 --features imbalance basis
+
+Live strategies are fetched in threads sharing one ClickHouse connection pool,
+``info`` once per strategy and fills once per (strategy, coin), each backtest
+directory is loaded once inside a render worker, and every
+(strategy, coin) figure is rendered on a process pool. pandas, Bokeh and
+clickhouse_connect are only imported once work actually starts.
+"""
+
+import argparse
+import datetime
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+
+def _parse_time(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+
+def build_parser(parser: argparse.ArgumentParser | None = None):
+    parser = parser or argparse.ArgumentParser(prog="python -m viz report")
+    parser.add_argument("--start", type=_parse_time, required=True)
+    parser.add_argument("--end", type=_parse_time, required=True)
+    parser.add_argument("--coins", nargs="+", required=True)
+    parser.add_argument("--strategies", nargs="*", default=[])
+    parser.add_argument("--backtests", nargs="*", default=[])
+    parser.add_argument("--features", nargs="*", default=[])
+    parser.add_argument("--out", default="reports")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--fetch-threads", type=int, default=4)
+    parser.add_argument("--max-rows", type=int, default=5_000_000)
+    parser.add_argument("--inline", action="store_true", help="embed BokehJS")
+    parser.add_argument("--host", default=os.environ.get("CLICKHOUSE_HOST"))
+    parser.add_argument("--port", type=int, default=os.environ.get("CLICKHOUSE_PORT"))
+    parser.add_argument("--username", default=os.environ.get("CLICKHOUSE_USER"))
+    parser.add_argument("--password", default=os.environ.get("CLICKHOUSE_PASSWORD"))
+    return parser
+
+
+class ClientFactory:
+    # One urllib3 pool shared by a client per fetch thread
+    def __init__(self, args, pool_size: int):
+        import clickhouse_connect
+        from clickhouse_connect.driver import httputil
+
+        self._get_client = clickhouse_connect.get_client
+        self._pool = httputil.get_pool_manager(maxsize=pool_size)
+        self._kwargs = {
+            k: v
+            for k, v in dict(
+                host=args.host,
+                port=args.port,
+                username=args.username,
+                password=args.password,
+            ).items()
+            if v is not None
+        }
+        self._local = threading.local()
+
+    def get(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = self._get_client(
+                pool_mgr=self._pool, autogenerate_session_id=False, **self._kwargs
+            )
+        return self._local.client
+
+
+def fetch_info(client_factory, strategy, coins, start, end) -> dict:
+    # info has no coin filter, so it is fetched once per strategy and split
+    from . import data_fetching
+
+    info_df = data_fetching.info(client_factory.get(), start, end, strategy)
+    coin_col = next((c for c in ("coin", "friendly_coin") if c in info_df), None)
+    if coin_col is None:
+        return {coin: info_df for coin in coins}
+    return {coin: info_df[info_df[coin_col] == coin] for coin in coins}
+
+
+def fetch_fills(client_factory, strategy, coin, start, end):
+    from . import data_fetching
+
+    fills_df = data_fetching.tq_trades(
+        client_factory.get(), start, end, coin_filter=coin, strategy_filter=strategy
+    )
+    if "strategy_name" not in fills_df.columns:
+        fills_df["strategy_name"] = strategy
+    return fills_df
+
+
+def load_backtest(directory, coins, max_rows) -> dict:
+    from . import data_fetching
+
+    frames = {
+        "theos": data_fetching.backtest_theos(directory, coins, max_rows=max_rows),
+        "fills": data_fetching.backtest_fills(directory, coins, max_rows=max_rows),
+    }
+    if not frames["fills"].empty:
+        frames["fills"]["strategy_name"] = os.path.basename(directory.rstrip("/"))
+    return frames
+
+
+def _coin_frames(frames: dict, coin: str) -> dict:
+    out = {}
+    for name, df in frames.items():
+        coin_col = next((c for c in ("friendly_coin", "coin") if c in df), None)
+        out[name] = df if coin_col is None else df[df[coin_col] == coin]
+    return out
+
+
+def render_report(job: dict) -> str:
+    from bokeh.embed import file_html
+    from bokeh.plotting import figure
+    from bokeh.resources import CDN, INLINE
+
+    from . import plotting
+
+    frames = job["frames"]
+    title = f"{job['name']} {job['coin']}"
+    fig = figure(
+        title=title,
+        x_axis_type="datetime",
+        sizing_mode="stretch_both",
+        tools="pan,wheel_zoom,box_zoom,reset,save",
+    )
+    theos = frames.get("theos")
+    if theos is not None and not theos.empty:
+        features = [f for f in job["features"] if f in theos.columns]
+        plotting.add_theo_and_features_to_fig(
+            fig, theos, features, include_features=bool(features)
+        )
+    info_df = frames.get("info")
+    if info_df is not None and not info_df.empty:
+        plotting.add_theo_with_lean_to_fig(fig, info_df)
+    fills_df = frames.get("fills")
+    if fills_df is not None and not fills_df.empty:
+        plotting.add_fills_to_fig(fig, fills_df)
+    if fig.renderers:
+        fig.legend.click_policy = "hide"
+
+    path = os.path.join(job["out"], f"{job['name']}_{job['coin']}.html")
+    html = file_html(fig, INLINE if job["inline"] else CDN, title)
+    with open(path, "w") as f:
+        f.write(html)
+    return path
+
+
+def render_backtest(job: dict) -> list[str]:
+    # Each jsonl file is parsed once per directory, not once per coin
+    frames = load_backtest(job["directory"], job["coins"], job["max_rows"])
+    return [
+        render_report(dict(job, coin=coin, frames=_coin_frames(frames, coin)))
+        for coin in job["coins"]
+    ]
+
+
+def _write_index(out_dir: str, paths: list[str]):
+    links = "\n".join(
+        f'<li><a href="{os.path.basename(p)}">{os.path.basename(p)}</a></li>'
+        for p in sorted(paths)
+    )
+    with open(os.path.join(out_dir, "index.html"), "w") as f:
+        f.write(f"<html><body><ul>\n{links}\n</ul></body></html>\n")
+
+
+def run(args) -> tuple[list[str], list[str]]:
+    import multiprocessing
+
+    os.makedirs(args.out, exist_ok=True)
+    base = {"features": args.features, "out": args.out, "inline": args.inline}
+    paths, errors = [], []
+
+    # spawn, not fork: the parent has fetch threads holding sockets and locks
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as renderers:
+        pending = {}
+        for directory in args.backtests:
+            job = dict(
+                base,
+                name=os.path.basename(directory.rstrip("/")),
+                coin=",".join(args.coins),
+                coins=args.coins,
+                directory=directory,
+                max_rows=args.max_rows,
+            )
+            pending[renderers.submit(render_backtest, job)] = job
+
+        if args.strategies:
+            factory = ClientFactory(args, pool_size=args.fetch_threads)
+            with ThreadPoolExecutor(max_workers=args.fetch_threads) as fetchers:
+                fetches = {}
+                for strategy in args.strategies:
+                    future = fetchers.submit(
+                        fetch_info, factory, strategy, args.coins, args.start, args.end
+                    )
+                    fetches[future] = (strategy, None)
+                    for coin in args.coins:
+                        future = fetchers.submit(
+                            fetch_fills, factory, strategy, coin, args.start, args.end
+                        )
+                        fetches[future] = (strategy, coin)
+
+                frames = {}
+                for future in as_completed(fetches):
+                    strategy, coin = fetches[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(f"{strategy} {coin or 'info'}: {e}")
+                        continue
+                    if coin is None:
+                        ready = [(c, {"info": df}) for c, df in result.items()]
+                    else:
+                        ready = [(coin, {"fills": result})]
+                    for c, found in ready:
+                        job_frames = frames.setdefault((strategy, c), {})
+                        job_frames.update(found)
+                        if len(job_frames) == 2:
+                            job = dict(base, name=strategy, coin=c, frames=job_frames)
+                            pending[renderers.submit(render_report, job)] = job
+
+        for future in as_completed(pending):
+            job = pending[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append(f"{job['name']} {job['coin']}: {e}")
+                continue
+            paths.extend(result if isinstance(result, list) else [result])
+
+    _write_index(args.out, paths)
+    for error in errors:
+        print(f"failed: {error}")
+    print(f"wrote {len(paths)} reports to {args.out}")
+    return paths, errors